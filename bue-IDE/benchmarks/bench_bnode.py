@@ -0,0 +1,47 @@
+# Parser speed for .bnode definitions (nodes per second).
+#   python benchmarks/bench_bnode.py [count]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bnode
+
+SAMPLE = """name: Math Node {i}
+inputs: Input1, Input2
+outputs: Result
+input_types: int, int
+output_types: int
+input_colors: 255, 0, 0; 0, 255, 0
+output_colors: 0, 0, 255
+symbol: +
+symbol_color: 255, 255, 255
+node_color: 100, 100, 255
+description: suma el imput a con el b.
+code: |
+    total = Input1 + Input2
+    return total
+lock: false
+width: 200
+height: 150
+"""
+
+
+def main(count):
+    texts = [SAMPLE.format(i=i) for i in range(count)]
+    start = time.perf_counter()
+    for text in texts:
+        bnode.loads(text)
+    elapsed = time.perf_counter() - start
+    print(f"parsed {count} definitions in {elapsed * 1000:.1f} ms ({count / elapsed:,.0f} nodes/s)")
+
+    data = bnode.loads(texts[0])
+    start = time.perf_counter()
+    for _ in range(count):
+        bnode.dumps(data)
+    elapsed = time.perf_counter() - start
+    print(f"wrote {count} definitions in {elapsed * 1000:.1f} ms ({count / elapsed:,.0f} nodes/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
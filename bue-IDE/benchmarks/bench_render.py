@@ -0,0 +1,78 @@
+# Frame time of the wires and port circles, one draw call each (as the IDE
+# did before renderer.py) against the PrimitiveBatch.
+#   python benchmarks/bench_render.py [ports]
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pygame
+import renderer
+from renderer import PrimitiveBatch
+
+WIDTH, HEIGHT = 1500, 800
+COLORS = [(0, 174, 255), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+
+def scene(ports):
+    # Nodes with two inputs and two outputs, one wire per output
+    random.seed(1)
+    nodes = []
+    for _ in range(ports // 4):
+        x = random.uniform(0, WIDTH - 200)
+        y = random.uniform(0, HEIGHT - 150)
+        nodes.append([(x, y + 40), (x, y + 70), (x + 200, y + 40), (x + 200, y + 70)])
+    circles = [(COLORS[i % 4], port) for node in nodes for i, port in enumerate(node)]
+    wires = []
+    for node in nodes:
+        for output in node[2:]:
+            wires.append((output, random.choice(nodes)[random.randrange(2)]))
+    return circles, wires
+
+
+def draw_direct(surface, circles, wires, zoom):
+    for color, pos in circles:
+        pygame.draw.circle(surface, color, (int(pos[0]), int(pos[1])), int(8 * zoom))
+    for start_pos, end_pos in wires:
+        control1 = (start_pos[0] + 100 * zoom, start_pos[1])
+        control2 = (end_pos[0] - 100 * zoom, end_pos[1])
+        points = [(start_pos[0], start_pos[1])]
+        for t in range(1, 100):
+            t = t / 100
+            x = (1-t)**3 * start_pos[0] + 3*(1-t)**2 * t * control1[0] + 3*(1-t) * t**2 * control2[0] + t**3 * end_pos[0]
+            y = (1-t)**3 * start_pos[1] + 3*(1-t)**2 * t * control1[1] + 3*(1-t) * t**2 * control2[1] + t**3 * end_pos[1]
+            points.append((int(x), int(y)))
+        pygame.draw.lines(surface, COLORS[0], False, points, int(2 * zoom))
+
+
+def draw_batched(surface, circles, wires, zoom, batch):
+    for color, pos in circles:
+        batch.circle(color, pos, int(8 * zoom))
+    for start_pos, end_pos in wires:
+        batch.curve(COLORS[0], start_pos, end_pos, 100 * zoom, int(2 * zoom))
+    batch.flush(surface)
+
+
+def measure(draw, frames=3):
+    start = time.perf_counter()
+    for _ in range(frames):
+        draw()
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def main(ports):
+    pygame.init()
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    circles, wires = scene(ports)
+    batch = PrimitiveBatch()
+    print(f"{len(circles)} ports, {len(wires)} wires (NumPy: {'yes' if renderer.numpy_module() is not None else 'no'})")
+    direct = measure(lambda: draw_direct(surface, circles, wires, 1.0))
+    batched = measure(lambda: draw_batched(surface, circles, wires, 1.0, batch))
+    print(f"one call each: {direct:.1f} ms/frame")
+    print(f"batched:       {batched:.1f} ms/frame ({direct / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
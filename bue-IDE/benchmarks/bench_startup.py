@@ -0,0 +1,44 @@
+# Startup time of the IDE: process start to the first frame on screen, over a
+# few runs (with the dummy video driver, so no window opens). Fails (exit code
+# 1) when the median goes over the budget. Runs with --no-session, so a session
+# cache left by the IDE doesn't change the numbers.
+#   python benchmarks/bench_startup.py [runs] [budget ms]
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+IDE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bue-IDE_4.5.py")
+BUDGET_MS = 400  # Process start to first frame
+
+
+def run_once():
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, IDE, "--startup-time", "--no-session"], cwd=os.path.dirname(IDE), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    wall = (time.perf_counter() - start) * 1000
+    # "imports 70.2 ms, init 16.3 ms, first frame 19.8 ms, total 106.3 ms"
+    phases = {}
+    for part in output.strip().splitlines()[-1].split(", "):
+        name, value, _ = part.rsplit(" ", 2)
+        phases[name] = float(value)
+    phases["process"] = wall
+    return phases
+
+
+def main(runs, budget):
+    results = [run_once() for _ in range(runs)]
+    medians = {name: statistics.median(result[name] for result in results) for name in results[0]}
+    print(f"{runs} runs, median: " + ", ".join(f"{name} {value:.0f} ms" for name, value in medians.items()))
+    print("  process = interpreter start to exit, measured from outside")
+    if medians["process"] > budget:
+        print(f"over the budget of {budget} ms")
+        return 1
+    print(f"within the budget of {budget} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5, float(sys.argv[2]) if len(sys.argv) > 2 else BUDGET_MS))
@@ -0,0 +1,103 @@
+# Cost of the labels of a frame, drawn three ways: font.render() per string
+# (the panels), surfaces cached per string (the nodes, render_text) and a glyph
+# atlas (every glyph rendered once, a label is one blits() call of glyph rects;
+# kept here only as the measured alternative: SDL_ttf caches its glyphs already,
+# and one blit per glyph costs more than rendering the whole string). Then the
+# cost of a value label by the length of its repr, which is what the side panel
+# cuts short (LABEL_CHARS in the IDE).
+#   python benchmarks/bench_text.py [labels]
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+COLOR = (200, 200, 200)
+FRAMES = 50
+
+
+class GlyphAtlas:
+    def __init__(self, font):
+        self.font = font
+        glyphs = [(chr(c), font.render(chr(c), True, COLOR)) for c in range(32, 127)]
+        self.surface = pygame.Surface((sum(glyph.get_width() for _, glyph in glyphs), max(glyph.get_height() for _, glyph in glyphs)),
+                                      pygame.SRCALPHA)
+        self.glyphs = {}  # {char: (rect in the atlas, advance)}
+        x = 0
+        for char, glyph in glyphs:
+            self.surface.blit(glyph, (x, 0))
+            self.glyphs[char] = (pygame.Rect(x, 0, glyph.get_width(), glyph.get_height()), font.metrics(char)[0][4])
+            x += glyph.get_width()
+
+    def draw(self, surface, text, pos):
+        x, y = pos
+        places = []
+        for char in text:
+            rect, advance = self.glyphs[char]
+            places.append((self.surface, (x, y), rect))
+            x += advance
+        surface.blits(places, doreturn=False)
+
+
+def labels(count, frame, live):
+    if live:
+        return [f"{i}. Out{i % 4} = {frame * 1.37 + i:.4f}" for i in range(count)]
+    return [f"{i}. Input{i % 4}" for i in range(count)]
+
+
+def draw_render(surface, font, texts, cache):
+    for i, text in enumerate(texts):
+        surface.blit(font.render(text, True, COLOR), (20, i % 40 * 20))
+
+
+def draw_cached(surface, font, texts, cache):
+    for i, text in enumerate(texts):
+        rendered = cache.get(text)
+        if rendered is None:
+            if len(cache) > 4096:
+                cache.clear()
+            rendered = font.render(text, True, COLOR)
+            cache[text] = rendered
+        surface.blit(rendered, (20, i % 40 * 20))
+
+
+def draw_atlas(surface, atlas, texts, cache):
+    for i, text in enumerate(texts):
+        atlas.draw(surface, text, (20, i % 40 * 20))
+
+
+def frame_time(draw, target, count, live):
+    surface = pygame.Surface((800, 800))
+    cache = {}
+    draw(surface, target, labels(count, 0, live), cache)  # Warm up
+    frames = [labels(count, frame + 1, live) for frame in range(FRAMES)]
+    start = time.perf_counter()
+    for texts in frames:
+        draw(surface, target, texts, cache)
+    return (time.perf_counter() - start) / FRAMES * 1000
+
+
+def main(count):
+    pygame.display.init()
+    pygame.font.init()
+    font = pygame.font.Font(None, 24)
+    atlas = GlyphAtlas(font)
+    print(f"{count} labels per frame, size 24 (ms per frame)")
+    for live in (False, True):
+        print("  values changing every frame" if live else "  fixed labels")
+        for name, draw, target in (("font.render", draw_render, font), ("cached surfaces", draw_cached, font),
+                                   ("glyph atlas", draw_atlas, atlas)):
+            print(f"    {name:16} {frame_time(draw, target, count, live):7.3f}")
+
+    print("one value label by the length of the value (a list of n ints)")
+    for n in (10, 1000, 100000):
+        text = f"1. Result = {list(range(n))!r}"
+        start = time.perf_counter()
+        width, height = font.render(text, True, COLOR).get_size()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"    n={n:<7} {len(text):7} chars {elapsed:8.2f} ms, surface {width}x{height} ({width * height * 4 / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
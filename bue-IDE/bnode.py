@@ -0,0 +1,220 @@
+# Lector/escritor de archivos .bnode
+#
+# A .bnode file is a list of "key: value" lines. Blank lines and lines starting
+# with "#" are ignored. Every key may appear once:
+#
+#   name           text                     default "Node"
+#   inputs         names separated by ","   default none
+#   outputs        names separated by ","   default none
+#   input_types    one type per input       default "Any" for every input
+#   output_types   one type per output      default "Any" for every output
+#   input_colors   "r, g, b" per input, separated by ";"   default (0, 174, 255)
+#   output_colors  "r, g, b" per output, separated by ";"  default (0, 174, 255)
+#   symbol         text                     default ""
+#   symbol_color   r, g, b                  default 255, 255, 255
+#   node_color     r, g, b                  default 100, 100, 255
+#   description    text                     default ""
+#   code           text, or a block         default ""
+#   lock           true / false             default false
+#   pure           true / false             default false (the code only depends
+#                  on its inputs: macros made of pure nodes cache their results)
+#   width          integer > 0              default 200
+#   height         integer > 0              default 150
+#
+# A value of "|" starts a block: the following indented lines (blank lines
+# included) are the value, with the common indentation removed. This is how
+# multi-line code is written:
+#
+#   code: |
+#       total = Input1 + Input2
+#       return total
+#
+# Errors raise BnodeError with the line number of the offending line.
+import textwrap
+
+DEFAULT_PORT_COLOR = (0, 174, 255)
+
+
+class BnodeError(ValueError):
+    def __init__(self, message, line=None, filename=None):
+        self.message = message
+        self.line = line
+        self.filename = filename
+        super().__init__(str(self))
+
+    def __str__(self):
+        where = self.filename or "<bnode>"
+        if self.line is not None:
+            where += f":{self.line}"
+        return f"{where}: {self.message}"
+
+
+def _text(value, line):
+    return value
+
+
+def _names(value, line):
+    names = [item.strip() for item in value.split(",")]
+    if names == [""]:
+        return []
+    if "" in names:
+        raise BnodeError("empty name in list", line)
+    return names
+
+
+def _color(value, line):
+    parts = [part.strip() for part in value.split(",")]
+    if len(parts) != 3:
+        raise BnodeError(f"color must be 'r, g, b', got {value!r}", line)
+    color = []
+    for part in parts:
+        if not (part.isascii() and part.isdigit()) or int(part) > 255:
+            raise BnodeError(f"color component must be 0-255, got {part!r}", line)
+        color.append(int(part))
+    return tuple(color)
+
+
+def _colors(value, line):
+    if not value.strip():
+        return []
+    return [_color(item, line) for item in value.split(";")]
+
+
+def _bool(value, line):
+    lowered = value.lower()
+    if lowered not in ("true", "false"):
+        raise BnodeError(f"expected true or false, got {value!r}", line)
+    return lowered == "true"
+
+
+def _size(value, line):
+    if not (value.isascii() and value.isdigit()) or int(value) == 0:
+        raise BnodeError(f"expected a positive integer, got {value!r}", line)
+    return int(value)
+
+
+# key: (parser, default)
+SCHEMA = {
+    "name": (_text, "Node"),
+    "inputs": (_names, []),
+    "outputs": (_names, []),
+    "input_types": (_names, None),
+    "output_types": (_names, None),
+    "input_colors": (_colors, None),
+    "output_colors": (_colors, None),
+    "symbol": (_text, ""),
+    "symbol_color": (_color, (255, 255, 255)),
+    "node_color": (_color, (100, 100, 255)),
+    "description": (_text, ""),
+    "code": (_text, ""),
+    "lock": (_bool, False),
+    "pure": (_bool, False),
+    "width": (_size, 200),
+    "height": (_size, 150),
+}
+
+
+def _tokenize(text):
+    # Single pass over the lines, yields (line number, key, value)
+    block_key = None
+    block_line = 0
+    block = []
+    for number, raw in enumerate(text.splitlines(), 1):
+        if block_key is not None:
+            if not raw.strip() or raw[0] in " \t":
+                block.append(raw)
+                continue
+            yield block_line, block_key, textwrap.dedent("\n".join(block)).strip("\n")
+            block_key = None
+        stripped = raw.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if ":" not in stripped:
+            raise BnodeError(f"expected 'key: value', got {stripped!r}", number)
+        key, value = stripped.split(":", 1)
+        key = key.strip()
+        value = value.strip()
+        if value == "|":
+            block_key = key
+            block_line = number
+            block = []
+        else:
+            yield number, key, value
+    if block_key is not None:
+        yield block_line, block_key, textwrap.dedent("\n".join(block)).strip("\n")
+
+
+def _port_list(data, lines, key, count, default):
+    values = data.get(key)
+    if values is None or values == []:
+        return [default] * count
+    if len(values) != count:
+        raise BnodeError(f"{key} has {len(values)} entries for {count} ports", lines.get(key))
+    return values
+
+
+def loads(text, filename=None):
+    # Parses a .bnode definition into a dict with every key of SCHEMA
+    data = {}
+    lines = {}
+    try:
+        for line, key, value in _tokenize(text):
+            if key not in SCHEMA:
+                raise BnodeError(f"unknown key {key!r}", line)
+            if key in data:
+                raise BnodeError(f"duplicate key {key!r} (first at line {lines[key]})", line)
+            data[key] = SCHEMA[key][0](value, line)
+            lines[key] = line
+
+        for key, (parser, default) in SCHEMA.items():
+            if key not in data and default is not None:
+                data[key] = list(default) if isinstance(default, list) else default
+
+        inputs = len(data["inputs"])
+        outputs = len(data["outputs"])
+        data["input_types"] = _port_list(data, lines, "input_types", inputs, "Any")
+        data["output_types"] = _port_list(data, lines, "output_types", outputs, "Any")
+        data["input_colors"] = _port_list(data, lines, "input_colors", inputs, DEFAULT_PORT_COLOR)
+        data["output_colors"] = _port_list(data, lines, "output_colors", outputs, DEFAULT_PORT_COLOR)
+    except BnodeError as error:
+        error.filename = filename
+        raise
+    return data
+
+
+def load(filename):
+    # utf-8-sig: editors on Windows may start the file with a BOM
+    with open(filename, "r", encoding="utf-8-sig") as file:
+        return loads(file.read(), filename)
+
+
+def _format_value(key, value):
+    if key in ("inputs", "outputs", "input_types", "output_types"):
+        return ", ".join(value)
+    if key in ("input_colors", "output_colors"):
+        return "; ".join(", ".join(str(c) for c in color) for color in value)
+    if key in ("symbol_color", "node_color"):
+        return ", ".join(str(c) for c in value)
+    if key in ("lock", "pure"):
+        return "true" if value else "false"
+    return str(value)
+
+
+def dumps(data):
+    # Inverse of loads; keys missing from data are left out
+    lines = []
+    for key in SCHEMA:
+        if key not in data:
+            continue
+        value = _format_value(key, data[key])
+        if "\n" in value or value == "|":
+            lines.append(f"{key}: |")
+            lines.extend("    " + line if line else "" for line in value.split("\n"))
+        else:
+            lines.append(f"{key}: {value}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(data, filename):
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(dumps(data))
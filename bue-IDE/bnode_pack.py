@@ -0,0 +1,189 @@
+# Librerias de nodos (.bnode) con indice precompilado.
+#
+# A library pack is either:
+#   - a directory tree of .bnode files, with an "index.bidx" file at its root
+#   - a single "<name>.bpack" archive (all the .bnode files one after the
+#     other) with a "<name>.bidx" index next to it
+#
+# The index is JSON and holds, for every node, its name, category (sub folder),
+# description, port names/types and where its definition lives (file, byte
+# offset and length; the length is null for the files of a directory, which
+# are read whole). The IDE builds the palette from the index alone and only
+# reads a full definition when a node is dropped on the canvas.
+#
+# Usage:
+#   python bnode_pack.py index <folder>            (re)build <folder>/index.bidx
+#   python bnode_pack.py pack <folder> <out.bpack> build an archive and its index
+import json
+import os
+import sys
+
+import bnode
+
+INDEX_VERSION = 2
+DIRECTORY_INDEX = "index.bidx"
+
+
+def _entry(name, category, text, file, offset, length):
+    # Only the fields needed by the palette; the full definition is read later.
+    # Invalid definitions are reported and left out of the index.
+    try:
+        data = bnode.loads(text, f"{category}/{name}.bnode" if category else f"{name}.bnode")
+    except bnode.BnodeError as error:
+        print(error)
+        return None
+    entry = {"name": name, "category": category, "file": file, "offset": offset, "length": length}
+    for key in ("description", "inputs", "outputs", "input_types", "output_types"):
+        entry[key] = data[key]
+    return entry
+
+
+def _walk_bnodes(folder):
+    # (category, file name, relative path) of every .bnode below folder, sorted
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        category = os.path.relpath(root, folder).replace(os.sep, "/")
+        if category == ".":
+            category = ""
+        for f in sorted(files):
+            if f.endswith(".bnode"):
+                yield category, f, os.path.relpath(os.path.join(root, f), folder).replace(os.sep, "/")
+
+
+def _library_stats(folder):
+    # Adding, removing or renaming a .bnode changes the mtime of its folder;
+    # editing one in place only changes its own size and mtime
+    stats = {}
+    for root, dirs, files in os.walk(folder):
+        stats[os.path.relpath(root, folder).replace(os.sep, "/")] = os.stat(root).st_mtime_ns
+        for f in files:
+            if f.endswith(".bnode"):
+                stat = os.stat(os.path.join(root, f))
+                stats[os.path.relpath(os.path.join(root, f), folder).replace(os.sep, "/")] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def build_directory_index(folder):
+    entries = []
+    for category, f, relpath in _walk_bnodes(folder):
+        with open(os.path.join(folder, relpath), "rb") as file:
+            raw = file.read()
+        entry = _entry(f[:-len(".bnode")], category, raw.decode("utf-8-sig"), relpath, 0, None)
+        if entry is not None:
+            entries.append(entry)
+    return {"version": INDEX_VERSION, "kind": "directory", "stats": _library_stats(folder), "nodes": entries}
+
+
+def build_archive(folder, archive_path):
+    entries = []
+    with open(archive_path, "wb") as archive:
+        for category, f, relpath in _walk_bnodes(folder):
+            with open(os.path.join(folder, relpath), "rb") as file:
+                raw = file.read()
+            if not raw.endswith(b"\n"):
+                raw += b"\n"
+            entry = _entry(f[:-len(".bnode")], category, raw.decode("utf-8-sig"),
+                           os.path.basename(archive_path), archive.tell(), len(raw))
+            if entry is not None:
+                archive.write(raw)
+                entries.append(entry)
+    index = {"version": INDEX_VERSION, "kind": "archive", "nodes": entries}
+    write_index(index, archive_index_path(archive_path))
+    return index
+
+
+def archive_index_path(archive_path):
+    return os.path.splitext(archive_path)[0] + ".bidx"
+
+
+def write_index(index, path):
+    with open(path, "w") as file:
+        json.dump(index, file)
+
+
+def read_index(path):
+    with open(path, "r") as file:
+        index = json.load(file)
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def save_directory_index(folder, index):
+    path = os.path.join(folder, DIRECTORY_INDEX)
+    write_index(index, path)
+    # Creating the index changes the folder mtime
+    index["stats"] = _library_stats(folder)
+    write_index(index, path)
+    return path
+
+
+def _directory_index(folder):
+    # Uses index.bidx when it is up to date, otherwise rebuilds it (and tries to
+    # save it for the next start; the library may be read only)
+    path = os.path.join(folder, DIRECTORY_INDEX)
+    if os.path.exists(path):
+        index = read_index(path)
+        if index is not None and index.get("stats") == _library_stats(folder):
+            return index
+    index = build_directory_index(folder)
+    try:
+        save_directory_index(folder, index)
+    except OSError:
+        pass
+    return index
+
+
+def load_library(folder):
+    # Returns the index entries of every node in folder, with "path" set to the
+    # file that holds each definition
+    if not os.path.isdir(folder):
+        return []
+    nodes = []
+    for entry in _directory_index(folder)["nodes"]:
+        entry["path"] = os.path.join(folder, entry["file"])
+        nodes.append(entry)
+    for f in sorted(os.listdir(folder)):
+        if f.endswith(".bpack"):
+            index_path = archive_index_path(os.path.join(folder, f))
+            if not os.path.exists(index_path):
+                continue
+            index = read_index(index_path)
+            if index is None:
+                continue
+            for entry in index["nodes"]:
+                entry["path"] = os.path.join(folder, f)
+                nodes.append(entry)
+    return nodes
+
+
+def library_signature(folder):
+    # What load_library's result depends on: the stats of the folders and
+    # .bnode files and the index files it reads (hash them to tell whether the library changed since)
+    if not os.path.isdir(folder):
+        return {}, []
+    files = [os.path.join(folder, DIRECTORY_INDEX)]
+    for f in sorted(os.listdir(folder)):
+        if f.endswith(".bpack"):
+            files.append(archive_index_path(os.path.join(folder, f)))
+    return _library_stats(folder), files
+
+
+def read_definition(path, offset=0, length=None):
+    with open(path, "rb") as file:
+        file.seek(offset)
+        raw = file.read() if length is None else file.read(length)
+    return raw.decode("utf-8-sig")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "index":
+        index = build_directory_index(sys.argv[2])
+        path = save_directory_index(sys.argv[2], index)
+        print(f"{len(index['nodes'])} nodes -> {path}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "pack":
+        index = build_archive(sys.argv[2], sys.argv[3])
+        print(f"{len(index['nodes'])} nodes -> {sys.argv[3]}")
+    else:
+        print("usage: bnode_pack.py index <folder> | pack <folder> <out.bpack>")
+        sys.exit(1)
@@ -1,18 +1,49 @@
-import pygame
 import sys
+import time
+
+STARTED = time.perf_counter()  # For --startup-time
+
+# Arranque rapido: pygame's package __init__ imports every optional module it
+# ships (sound, the NumPy array modules, pkg_resources for its data files),
+# which was most of the startup time. The IDE uses none of them, so they are
+# hidden while pygame is imported; afterwards they import normally, on first use.
+LAZY_MODULES = ("pygame.mixer", "pygame.mixer_music", "pygame.sndarray", "pygame.surfarray", "pygame.fastevent",
+                "pkg_resources")
+_hidden = [name for name in LAZY_MODULES if name not in sys.modules]
+sys.modules.update(dict.fromkeys(_hidden, None))
+try:
+    import pygame
+finally:
+    for name in _hidden:
+        if name in sys.modules and sys.modules[name] is None:
+            del sys.modules[name]
 import random
+import gc
 import json
+import reprlib
 import os
-
-pygame.init()
-pygame.SRCALPHA
+import math
+import multiprocessing
+from palette import PaletteIndex, PaletteEntry
+import bnode
+from executor import Executor, ExecutionError
+from sandbox import SandboxPool
+from spatial import SpatialHash
+from port_types import is_compatible
+from topo_order import TopologicalOrder
+from bnode_pack import load_library, library_signature, read_definition
+from layout import layout_graph
+from jobs import JobRunner
+from routing import RouteCache, route_box
+from renderer import PrimitiveBatch, curve_point, polyline_point
+from run_monitor import RunMonitor
+from run_trace import TraceWriter, TraceError, Replay, read_trace, resolve_path
+from session_cache import SESSION_FILE, code_key, file_hashes, load_session, project_entry, project_snapshot, save_session, unchanged
 
 WIDTH, HEIGHT = 1500, 800
 PANEL_WIDTH = 300
 TOP_PANEL_HEIGHT = 50
 PREDEFINED_PANEL_WIDTH = 200
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("BUE IDE v3.5")
 
 # Color palette
 BACKGROUND = (30, 30, 30)
@@ -28,109 +59,479 @@ BUTTON_COLOR = (80, 80, 80)
 BUTTON_HOVER_COLOR = (100, 100, 100)
 SAVE_BUTTON_COLOR = (200, 200, 200)
 SAVE_BUTTON_HOVER_COLOR = (150, 150, 150)
+SELECTION_COLOR = (255, 200, 0)
+COMPATIBLE_COLOR = (0, 220, 100)
+ERROR_COLOR = (230, 50, 50)
 TRANSPARENT_COLOR = (255, 255, 255, 100)
+MACRO_COLOR = (150, 100, 200)
+RUNNING_COLOR = (255, 170, 0)
+FLOW_COLOR = (255, 255, 255)
+STATE_COLORS = {"running": RUNNING_COLOR, "done": COMPATIBLE_COLOR, "error": ERROR_COLOR}
+
+# Zoom levels: the camera always settles on one of these, so the fonts and
+# sprites drawn for a level are reused (0.25x to 4x, four steps per doubling)
+ZOOM_LEVELS = [2 ** (step / 4) for step in range(-8, 9)]
+ZOOM_SPEED = 12  # How fast the animated zoom reaches its level
+
+# Caches of fonts, text and sprites by size (sizes come from the zoom levels)
+fonts = {}
+text_cache = {}
+sprite_cache = {}
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        font = pygame.font.Font(None, size)
+        fonts[size] = font
+    return font
+
+def render_text(text, size, color):
+    key = (text, size, tuple(color))  # Colors loaded from JSON are lists
+    surface = text_cache.get(key)
+    if surface is None:
+        if len(text_cache) > 4096:
+            text_cache.clear()
+        surface = get_font(size).render(text, True, color)
+        text_cache[key] = surface
+    return surface
+
+def node_sprite(size, header_color, zoom):
+    # Body, outline and header of a node
+    key = ("node", size, tuple(header_color), zoom)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        if len(sprite_cache) > 1024:
+            sprite_cache.clear()
+        sprite = pygame.Surface(size, pygame.SRCALPHA)
+        rect = sprite.get_rect()
+        pygame.draw.rect(sprite, NODE_BODY[:3], rect, border_radius=int(10 * zoom))
+        pygame.draw.rect(sprite, NODE_OUTLINE, rect, int(2 * zoom), border_radius=int(10 * zoom))
+        header_rect = pygame.Rect(0, 0, rect.width, 30 * zoom)
+        pygame.draw.rect(sprite, header_color, header_rect, border_top_left_radius=int(10 * zoom), border_top_right_radius=int(10 * zoom))
+        sprite_cache[key] = sprite
+    return sprite
+
+# Valores iguales de nodos distintos son un solo objeto: port lists become
+# tuples, colors too, and the texts are interned. A library node dropped many
+# times (or loaded from a .buepyt, where every string is a new object) then
+# only costs its rect and its slots, and tuples of strings and numbers are not
+# tracked by the garbage collector, whose passes went through every port list
+# of every node. Fields are never changed in place, only replaced.
+interned_values = {}
+
+def intern_value(value):
+    kind = type(value)
+    if kind is str:
+        return sys.intern(value)
+    if kind is list or kind is tuple:
+        # The strings of an interned tuple are those of the first one seen
+        if value and (type(value[0]) is list or type(value[0]) is tuple):
+            value = tuple([intern_value(item) for item in value])
+        else:
+            value = tuple(value)
+        return interned_values.setdefault(value, value)
+    return value
 
 # Node class with customizable properties
 class Node:
+    # Everything a node is besides its rect (saved in the snapshots, interned by compact())
+    FIELDS = ("name", "color", "inputs", "outputs", "content", "symbol", "center_text", "description",
+              "input_colors", "output_colors", "input_types", "output_types", "code", "lock", "symbol_color", "pure")
+    __slots__ = ("rect", "template") + FIELDS
+
     def __init__(self, x, y, width, height, name="Node", color=(100, 100, 255)):
         self.rect = pygame.Rect(x, y, width, height)
+        # values() of the .bnode it was made from, shared by all its copies (None: made here)
+        self.template = None
         self.name = name
         self.color = color
-        self.inputs = ["In1"]
-        self.outputs = ["Out1"]
+        self.inputs = ("In1",)
+        self.outputs = ("Out1",)
         self.content = "Content"
         self.symbol = ""  # Symbol in the upper corner
         self.center_text = ""  # Text in the center
         self.description = ""
-        self.input_colors = [(0, 174, 255) for _ in range(len(self.inputs))]  # Default input colors
-        self.output_colors = [(0, 174, 255) for _ in range(len(self.outputs))]  # Default output colors
-        self.input_types = ["Any" for _ in range(len(self.inputs))]  # Default input types
-        self.output_types = ["Any" for _ in range(len(self.outputs))]  # Default output types
+        self.input_colors = ((0, 174, 255),)  # Default input colors
+        self.output_colors = ((0, 174, 255),)  # Default output colors
+        self.input_types = ("Any",)  # Default input types
+        self.output_types = ("Any",)  # Default output types
         self.code = ""  # Code associated with the node
         self.lock = False  # Configuration lock
         self.symbol_color = (255, 255, 255)  # Default symbol color
+        self.pure = False  # Same inputs, same outputs (macros only cache pure nodes)
 
-    def draw(self, surface, camera, transparency=False):
+    def compact(self):
+        # After setting the fields from loaded data
+        for field in self.FIELDS:
+            setattr(self, field, intern_value(getattr(self, field)))
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def draw(self, surface, camera, transparency=False, batch=None):
+        # With a batch the port circles are queued and drawn by batch.flush()
+        target = batch or PrimitiveBatch()
         scaled_rect = pygame.Rect(
-            (self.rect.x - camera.rect.x) * camera.zoom,
-            (self.rect.y - camera.rect.y) * camera.zoom,
+            (self.rect.x - camera.x) * camera.zoom,
+            (self.rect.y - camera.y) * camera.zoom,
             self.rect.width * camera.zoom,
             self.rect.height * camera.zoom
         )
         
         # If transparency is True, draw a semi-transparent node
         node_color = self.color if not transparency else TRANSPARENT_COLOR
-        pygame.draw.rect(surface, NODE_BODY, scaled_rect, border_radius=int(10 * camera.zoom))
-        pygame.draw.rect(surface, NODE_OUTLINE, scaled_rect, int(2 * camera.zoom), border_radius=int(10 * camera.zoom))
-        
-        # Draw node header
-        header_rect = pygame.Rect(scaled_rect.x, scaled_rect.y, scaled_rect.width, 30 * camera.zoom)
-        pygame.draw.rect(surface, node_color, header_rect, border_top_left_radius=int(10 * camera.zoom), border_top_right_radius=int(10 * camera.zoom))
-        
-        font = pygame.font.Font(None, int(24 * camera.zoom))
-        
+        # Body, outline and header (one cached sprite per size, color and zoom)
+        surface.blit(node_sprite(scaled_rect.size, node_color, camera.zoom), scaled_rect)
+
+        text_size = int(24 * camera.zoom)
+
         # Draw node name (using the color of the node)
-        text = font.render(self.name, True, self.color)  # Set the color to the node color
+        text = render_text(self.name, text_size, self.color)  # Set the color to the node color
         text_rect = text.get_rect(center=(scaled_rect.centerx, scaled_rect.top + 15 * camera.zoom))
         surface.blit(text, text_rect)
         
         # Draw node content
-        content_text = font.render(self.content, True, NODE_TEXT)
+        content_text = render_text(self.content, text_size, NODE_TEXT)
         content_rect = content_text.get_rect(center=(scaled_rect.centerx, scaled_rect.centery + 15 * camera.zoom))
         surface.blit(content_text, content_rect)
 
         # Draw input and output connectors
+        radius = int(8 * camera.zoom)
         for i, input_name in enumerate(self.inputs):
             y = scaled_rect.top + (40 + i * 30) * camera.zoom
-            pygame.draw.circle(surface, self.input_colors[i], (scaled_rect.left, int(y)), int(8 * camera.zoom))
-            text = font.render(input_name, True, NODE_TEXT)
+            target.circle(self.input_colors[i], (scaled_rect.left, y), radius)
+            text = render_text(input_name, text_size, NODE_TEXT)
             surface.blit(text, (scaled_rect.left + 15 * camera.zoom, int(y) - 10 * camera.zoom))
 
         for i, output_name in enumerate(self.outputs):
             y = scaled_rect.top + (40 + i * 30) * camera.zoom
-            pygame.draw.circle(surface, self.output_colors[i], (scaled_rect.right, int(y)), int(8 * camera.zoom))
-            text = font.render(output_name, True, NODE_TEXT)
+            target.circle(self.output_colors[i], (scaled_rect.right, y), radius)
+            text = render_text(output_name, text_size, NODE_TEXT)
             surface.blit(text, (scaled_rect.right - 65 * camera.zoom, int(y) - 10 * camera.zoom))
+        if batch is None:
+            target.flush(surface)
 
     def is_over(self, pos, camera):
-        scaled_pos = (
-            (pos[0] + camera.rect.x) / camera.zoom,
-            (pos[1] + camera.rect.y) / camera.zoom
+        return self.rect.collidepoint(camera.screen_to_world(pos))
+
+    def get_input_port(self, pos, camera):
+        scaled_rect = pygame.Rect(
+            (self.rect.x - camera.x) * camera.zoom,
+            (self.rect.y - camera.y) * camera.zoom,
+            self.rect.width * camera.zoom,
+            self.rect.height * camera.zoom
+        )
+        for i in range(len(self.inputs)):
+            y = scaled_rect.top + (40 + i * 30) * camera.zoom
+            if pygame.Rect(scaled_rect.left - 10 * camera.zoom, y - 10 * camera.zoom, 20 * camera.zoom, 20 * camera.zoom).collidepoint(pos):
+                return i
+        return None
+
+    def get_output_port(self, pos, camera):
+        scaled_rect = pygame.Rect(
+            (self.rect.x - camera.x) * camera.zoom,
+            (self.rect.y - camera.y) * camera.zoom,
+            self.rect.width * camera.zoom,
+            self.rect.height * camera.zoom
+        )
+        for i in range(len(self.outputs)):
+            y = scaled_rect.top + (40 + i * 30) * camera.zoom
+            if pygame.Rect(scaled_rect.right - 10 * camera.zoom, y - 10 * camera.zoom, 20 * camera.zoom, 20 * camera.zoom).collidepoint(pos):
+                return i
+        return None
+
+    def port_position(self, port, is_output, camera):
+        x = self.rect.right if is_output else self.rect.left
+        return (
+            (x - camera.x) * camera.zoom,
+            (self.rect.top + 40 + port * 30 - camera.y) * camera.zoom
         )
-        return self.rect.collidepoint(scaled_pos)
 
     def move(self, dx, dy):
         self.rect.x += dx
         self.rect.y += dy
 
+# Nodo que agrupa otros nodos en su propio Project. Desde fuera se dibuja y se
+# ejecuta como un solo nodo; sus puertos son los puertos del borde del grupo.
+class MacroNode(Node):
+    __slots__ = ("inner", "input_map", "output_map", "result_cache")
+
+    def __init__(self, x, y, width, height, name="Macro", color=MACRO_COLOR):
+        super().__init__(x, y, width, height, name, color)
+        self.inner = Project()
+        self.input_map = []  # (inner node, input port) for each macro input
+        self.output_map = []  # (inner node, output port) for each macro output
+        self.result_cache = {}
+        self.update_ports()
+
+    def update_ports(self):
+        self.inputs = intern_value([node.inputs[port] for node, port in self.input_map])
+        self.outputs = intern_value([node.outputs[port] for node, port in self.output_map])
+        self.input_types = intern_value([node.input_types[port] for node, port in self.input_map])
+        self.output_types = intern_value([node.output_types[port] for node, port in self.output_map])
+        self.input_colors = intern_value([node.input_colors[port] for node, port in self.input_map])
+        self.output_colors = intern_value([node.output_colors[port] for node, port in self.output_map])
+        self.content = f"{len(self.inner.nodes)} nodes"
+        self.rect.height = max(150, 50 + max(len(self.inputs), len(self.outputs)) * 30)
+        self.result_cache.clear()
+
+    def draw(self, surface, camera, transparency=False, batch=None):
+        super().draw(surface, camera, transparency, batch)
+        inset = pygame.Rect(
+            (self.rect.x - camera.x) * camera.zoom,
+            (self.rect.y - camera.y) * camera.zoom,
+            self.rect.width * camera.zoom,
+            self.rect.height * camera.zoom
+        ).inflate(-8 * camera.zoom, -8 * camera.zoom)
+        pygame.draw.rect(surface, MACRO_COLOR, inset, max(1, int(2 * camera.zoom)), border_radius=int(8 * camera.zoom))
+
 # Project class to handle saving and loading projects
 class Project:
     def __init__(self):
         self.nodes = []
         self.connections = []
+        self.spatial = SpatialHash()
+        # Positions in the lists above, so removing is a swap with the last item
+        self._node_index = {}
+        self._connection_index = {}
+        # Connections of every node by port: {node: {port: [connections]}}.
+        # Lookups and removals only touch the wires of that node/port.
+        self._incoming = {}
+        self._outgoing = {}
+        # Connections whose output type doesn't fit the input type. Checked as
+        # wires are added, so the project never needs a full validation pass.
+        self.type_errors = set()
+        # Evaluation order, kept up to date as wires are added (and used to
+        # refuse wires that would close a cycle)
+        self.order = TopologicalOrder()
+        # Orthogonal wire routes, dropped when something moves near them
+        self.routes = RouteCache()
+        # Areas changed since the minimap last looked (None: redraw it all)
+        self.dirty = []
 
     def add_node(self, node):
+        self._node_index[node] = len(self.nodes)
         self.nodes.append(node)
+        self._incoming[node] = {}
+        self._outgoing[node] = {}
+        self.spatial.insert(node)
+        self.order.add(node)
+        self._changed(node.rect)
+
+    def _changed(self, rect):
+        # Nodes appeared, moved or went away inside rect
+        self.routes.invalidate(tuple(rect))
+        if self.dirty is not None:
+            self.dirty.append(pygame.Rect(rect))
+            if len(self.dirty) > 64:
+                self.dirty = None
+
+    def take_dirty(self):
+        dirty = self.dirty
+        self.dirty = []
+        return dirty
 
     def add_connection(self, connection):
+        # Raises CycleError (and adds nothing) if the wire would close a cycle
+        self.order.add_edge(connection.start_node, connection.end_node, self._successors, self._predecessors)
+        self._connection_index[connection] = len(self.connections)
         self.connections.append(connection)
+        self._outgoing[connection.start_node].setdefault(connection.start_port, []).append(connection)
+        self._incoming[connection.end_node].setdefault(connection.end_port, []).append(connection)
+        self._check_types(connection)
+
+    def connect(self, start_node, start_port, end_node, end_port):
+        # An input takes a single wire: connecting replaces what was there
+        old = list(self.incoming(end_node, end_port))
+        connection = Connection(start_node, end_node, start_port, end_port)
+        self.add_connection(connection)
+        for previous in old:
+            self.remove_connection(previous)
+        return connection
+
+    def _successors(self, node):
+        return [connection.end_node for connection in self.outgoing(node)]
+
+    def _predecessors(self, node):
+        return [connection.start_node for connection in self.incoming(node)]
+
+    def evaluation_order(self):
+        return self.order.order()
+
+    def upstream(self, nodes):
+        # The nodes and everything that feeds them
+        return self.order.reachable(nodes, self._predecessors)
+
+    def downstream(self, nodes):
+        return self.order.reachable(nodes, self._successors)
+
+    def _check_types(self, connection):
+        if is_compatible(connection.start_node.output_types[connection.start_port],
+                         connection.end_node.input_types[connection.end_port]):
+            self.type_errors.discard(connection)
+        else:
+            self.type_errors.add(connection)
+
+    def revalidate(self, node):
+        # After the port types of a node change
+        for connection in self.incoming(node) + self.outgoing(node):
+            self._check_types(connection)
+
+    def contains(self, node):
+        return node in self._node_index
+
+    def incoming(self, node, port=None):
+        # Connections arriving at node (at one input port, or at all of them)
+        ports = self._incoming[node]
+        if port is not None:
+            return ports.get(port, [])
+        return [connection for connections in ports.values() for connection in connections]
+
+    def outgoing(self, node, port=None):
+        ports = self._outgoing[node]
+        if port is not None:
+            return ports.get(port, [])
+        return [connection for connections in ports.values() for connection in connections]
+
+    def is_connected(self, node, port, is_output):
+        ports = self._outgoing[node] if is_output else self._incoming[node]
+        return bool(ports.get(port))
+
+    def _unlink(self, ports, port, connection):
+        connections = ports[port]
+        connections.remove(connection)
+        if not connections:
+            del ports[port]
+
+    def _swap_remove(self, items, index, item):
+        i = index.pop(item)
+        last = items.pop()
+        if last is not item:
+            items[i] = last
+            index[last] = i
+
+    def remove_connection(self, connection):
+        self._swap_remove(self.connections, self._connection_index, connection)
+        self._unlink(self._outgoing[connection.start_node], connection.start_port, connection)
+        self._unlink(self._incoming[connection.end_node], connection.end_port, connection)
+        self.type_errors.discard(connection)
+        self.routes.discard(connection)
+
+    def remove_nodes(self, nodes):
+        # Removes the nodes and every connection touching them
+        if not nodes:
+            return
+        for node in nodes:
+            for connection in self.incoming(node) + self.outgoing(node):
+                if connection in self._connection_index:
+                    self.remove_connection(connection)
+        for node in nodes:
+            self._swap_remove(self.nodes, self._node_index, node)
+            del self._incoming[node]
+            del self._outgoing[node]
+            self.spatial.remove(node)
+            self.order.remove(node)
+        # One dirty rect and one pass over the cached routes for the whole selection
+        self._changed(pygame.Rect(nodes[0].rect).unionall([node.rect for node in nodes]))
+
+    def move_nodes(self, nodes, dx, dy):
+        # Moves a group of nodes at once; returns the area that changed
+        # (old and new positions) as a single rect in world coordinates
+        if not nodes:
+            return None
+        dx = round(dx)
+        dy = round(dy)
+        dirty = pygame.Rect(nodes[0].rect).unionall([node.rect for node in nodes])
+        for node in nodes:
+            node.move(dx, dy)
+        self.spatial.update(nodes)
+        dirty = dirty.union(dirty.move(dx, dy))
+        self._changed(dirty)
+        return dirty
+
+    def place_nodes(self, nodes, positions):
+        # Moves every node to its own position at once (one spatial index
+        # update); returns the area that changed as a single rect
+        if not nodes:
+            return None
+        dirty = pygame.Rect(nodes[0].rect).unionall([node.rect for node in nodes])
+        for node, (x, y) in zip(nodes, positions):
+            node.rect.topleft = (x, y)
+        self.spatial.update(nodes)
+        dirty = dirty.unionall([node.rect for node in nodes])
+        self._changed(dirty)
+        return dirty
+
+    def node_at(self, pos):
+        # Topmost node under a world position
+        hits = self.spatial.query_point(pos[0], pos[1])
+        if not hits:
+            return None
+        return max(hits, key=self._node_index.get)
+
+    def visible_nodes(self, rect):
+        # Nodes inside rect, in drawing order
+        return sorted(self.nodes_in_rect(rect), key=self._node_index.get)
+
+    def nodes_in_rect(self, rect):
+        return [node for node in self.spatial.query_rect(rect.x, rect.y, rect.width, rect.height)]
+
+    def obstacles(self, box):
+        # Rects of the nodes inside a (x, y, width, height) box, for the wire routes
+        return [tuple(node.rect) for node in self.spatial.query_rect(*box)]
 
     def save(self, filename):
-        data = {
-            "nodes": [self._node_to_dict(node) for node in self.nodes],
-            "connections": [self._connection_to_dict(connection) for connection in self.connections]
-        }
         with open(filename, 'w') as file:
-            json.dump(data, file)
+            json.dump(self.to_dict(), file)
 
     def load(self, filename):
         with open(filename, 'r') as file:
             data = json.load(file)
-        self.nodes = [self._dict_to_node(node_data) for node_data in data["nodes"]]
-        self.connections = [self._dict_to_connection(conn_data) for conn_data in data["connections"]]
+        # Lots of new objects at once: the garbage collector running in
+        # between took most of the time with big projects
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self.from_dict(data)
+        finally:
+            if collecting:
+                gc.enable()
 
-    def _node_to_dict(self, node):
-        return {
+    def to_dict(self):
+        # The template of the nodes made from a .bnode is written once, in
+        # "templates"; those nodes only keep the fields changed since
+        templates = {}
+        data = {
+            "nodes": [self._node_to_dict(node, templates) for node in self.nodes],
+            "connections": [self._connection_to_dict(connection) for connection in self.connections]
+        }
+        if templates:
+            data["templates"] = [dict(zip(Node.FIELDS, template)) for template in templates]
+        return data
+
+    def from_dict(self, data):
+        self.__init__()
+        templates = [intern_value(tuple(intern_value(template[field]) for field in Node.FIELDS))
+                     for template in data.get("templates", ())]
+        for node_data in data["nodes"]:
+            self.add_node(self._dict_to_node(node_data, templates))
+        for conn_data in data["connections"]:
+            self.add_connection(self._dict_to_connection(conn_data))
+
+    def _node_to_dict(self, node, templates):
+        if node.template is not None:
+            data = {
+                "x": node.rect.x,
+                "y": node.rect.y,
+                "width": node.rect.width,
+                "height": node.rect.height,
+                "template": templates.setdefault(node.template, len(templates))
+            }
+            for field, value, base in zip(Node.FIELDS, node.values(), node.template):
+                if value is not base and value != base:
+                    data[field] = value
+            return data
+        data = {
             "x": node.rect.x,
             "y": node.rect.y,
             "width": node.rect.width,
@@ -149,18 +550,37 @@ class Project:
             "code": node.code,
             "lock": node.lock,
             "symbol_color": node.symbol_color,
+            "pure": node.pure,
             "color": node.color
         }
+        if isinstance(node, MacroNode):
+            data["macro"] = {
+                "project": node.inner.to_dict(),
+                "input_map": [[node.inner._node_index[n], port] for n, port in node.input_map],
+                "output_map": [[node.inner._node_index[n], port] for n, port in node.output_map]
+            }
+        return data
 
     def _connection_to_dict(self, connection):
         return {
-            "start_node": self.nodes.index(connection.start_node),
-            "end_node": self.nodes.index(connection.end_node),
+            "start_node": self._node_index[connection.start_node],
+            "end_node": self._node_index[connection.end_node],
             "start_port": connection.start_port,
             "end_port": connection.end_port
         }
 
-    def _dict_to_node(self, data):
+    def _dict_to_node(self, data, templates=()):
+        template = None
+        if "template" in data:
+            template = templates[data["template"]]
+            data = dict(zip(Node.FIELDS, template), **data)
+        if "macro" in data:
+            node = MacroNode(data["x"], data["y"], data["width"], data["height"], data["name"], data["color"])
+            node.inner.from_dict(data["macro"]["project"])
+            node.input_map = [(node.inner.nodes[i], port) for i, port in data["macro"]["input_map"]]
+            node.output_map = [(node.inner.nodes[i], port) for i, port in data["macro"]["output_map"]]
+            node.update_ports()
+            return node
         node = Node(data["x"], data["y"], data["width"], data["height"], data["name"], data["color"])
         node.inputs = data["inputs"]
         node.outputs = data["outputs"]
@@ -175,6 +595,9 @@ class Project:
         node.code = data["code"]
         node.lock = data["lock"]
         node.symbol_color = data["symbol_color"]
+        node.pure = data.get("pure", False)  # Not in projects saved before it existed
+        node.compact()
+        node.template = template
         return node
 
     def _dict_to_connection(self, data):
@@ -182,6 +605,61 @@ class Project:
         end_node = self.nodes[data["end_node"]]
         return Connection(start_node, end_node, data["start_port"], data["end_port"])
 
+    # Snapshot: the project as plain data together with what add_node and
+    # add_connection work out (spatial cells, evaluation order, type errors),
+    # so from_snapshot only puts it back. For the session cache; the .buepyt
+    # stays the real file.
+    def to_snapshot(self):
+        nodes = []
+        for node in self.nodes:
+            macro = None
+            if isinstance(node, MacroNode):
+                macro = (node.inner.to_snapshot(),
+                         [(node.inner._node_index[n], port) for n, port in node.input_map],
+                         [(node.inner._node_index[n], port) for n, port in node.output_map])
+            nodes.append((tuple(node.rect), node.values(), node.template, macro))
+        index = self._node_index
+        return {
+            "nodes": nodes,
+            "connections": [(index[c.start_node], c.start_port, index[c.end_node], c.end_port) for c in self.connections],
+            "cells": [self.spatial._cells[node] for node in self.nodes],
+            "order": [index[node] for node in self.order.order()],
+            "type_errors": [self._connection_index[connection] for connection in self.type_errors]
+        }
+
+    def from_snapshot(self, data):
+        self.__init__()
+        self.dirty = None  # Everything is new
+        for rect, values, template, macro in data["nodes"]:
+            kind = MacroNode if macro else Node
+            node = kind.__new__(kind)
+            for field, value in zip(Node.FIELDS, values):
+                setattr(node, field, value)
+            node.compact()
+            node.rect = pygame.Rect(rect)
+            node.template = intern_value(template)
+            if macro:
+                inner, input_map, output_map = macro
+                node.inner = Project()
+                node.inner.from_snapshot(inner)
+                node.input_map = [(node.inner.nodes[i], port) for i, port in input_map]
+                node.output_map = [(node.inner.nodes[i], port) for i, port in output_map]
+                node.result_cache = {}
+            self._node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+            self._incoming[node] = {}
+            self._outgoing[node] = {}
+        for start, start_port, end, end_port in data["connections"]:
+            connection = Connection(self.nodes[start], self.nodes[end], start_port, end_port)
+            self._connection_index[connection] = len(self.connections)
+            self.connections.append(connection)
+            self._outgoing[connection.start_node].setdefault(start_port, []).append(connection)
+            self._incoming[connection.end_node].setdefault(end_port, []).append(connection)
+        for node, cells in zip(self.nodes, data["cells"]):
+            self.spatial.restore(node, cells)
+        self.order.restore([self.nodes[i] for i in data["order"]])
+        self.type_errors = {self.connections[i] for i in data["type_errors"]}
+
 # Connection class
 class Connection:
     def __init__(self, start_node, end_node, start_port, end_port):
@@ -190,252 +668,1108 @@ class Connection:
         self.start_port = start_port
         self.end_port = end_port
 
-    def draw(self, surface, camera):
-        start_pos = (
-            (self.start_node.rect.right - camera.rect.x) * camera.zoom,
-            (self.start_node.rect.top + 40 + self.start_port * 30 - camera.rect.y) * camera.zoom
-        )
-        end_pos = (
-            (self.end_node.rect.left - camera.rect.x) * camera.zoom,
-            (self.end_node.rect.top + 40 + self.end_port * 30 - camera.rect.y) * camera.zoom
-        )
-        
-        # Calculate control points for the curve
-        control1 = (start_pos[0] + 100 * camera.zoom, start_pos[1])
-        control2 = (end_pos[0] - 100 * camera.zoom, end_pos[1])
-        
-        # Draw a Bezier curve
-        points = [(start_pos[0], start_pos[1])]
-        for t in range(1, 100):
-            t = t / 100
-            x = (1-t)**3 * start_pos[0] + 3*(1-t)**2 * t * control1[0] + 3*(1-t) * t**2 * control2[0] + t**3 * end_pos[0]
-            y = (1-t)**3 * start_pos[1] + 3*(1-t)**2 * t * control1[1] + 3*(1-t) * t**2 * control2[1] + t**3 * end_pos[1]
-            points.append((int(x), int(y)))
-        
-        pygame.draw.lines(surface, CONNECTOR_COLOR, False, points, int(2 * camera.zoom))
+    def endpoints(self):
+        # World positions of the output and input ports
+        return ((self.start_node.rect.right, self.start_node.rect.top + 40 + self.start_port * 30),
+                (self.end_node.rect.left, self.end_node.rect.top + 40 + self.end_port * 30))
+
+    def draw(self, surface, camera, color=CONNECTOR_COLOR, route=None, batch=None, flow=None):
+        # With a batch the wire is only queued (drawn by batch.flush()). flow
+        # (0 to 1) puts a pulse that far along the wire (data going through).
+        target = batch or PrimitiveBatch()
+        width = int(2 * camera.zoom)
+        radius = int(5 * camera.zoom)
+        if route:
+            # Orthogonal route (world points)
+            points = [((x - camera.x) * camera.zoom, (y - camera.y) * camera.zoom) for x, y in route]
+            target.lines(color, points, width)
+            if flow is not None:
+                target.circle(FLOW_COLOR, polyline_point(points, flow), radius)
+        else:
+            start, end = self.endpoints()
+            start_pos = ((start[0] - camera.x) * camera.zoom, (start[1] - camera.y) * camera.zoom)
+            end_pos = ((end[0] - camera.x) * camera.zoom, (end[1] - camera.y) * camera.zoom)
+            # Bezier curve with its control points 100 units out of the ports;
+            # it stays inside their box, so wires off the screen are skipped
+            bend = 100 * camera.zoom
+            if (max(start_pos[0], end_pos[0]) + bend < 0 or min(start_pos[0], end_pos[0]) - bend > surface.get_width()
+                    or max(start_pos[1], end_pos[1]) < 0 or min(start_pos[1], end_pos[1]) > surface.get_height()):
+                return
+            target.curve(color, start_pos, end_pos, bend, width)
+            if flow is not None:
+                target.circle(FLOW_COLOR, curve_point(start_pos, end_pos, bend, flow), radius)
+        if batch is None:
+            target.flush(surface)
 
+# screen = (world - (x, y)) * zoom. Zooming goes to the next level in
+# ZOOM_LEVELS and animates towards it, keeping the point under the cursor still.
 class Camera:
     def __init__(self, width, height):
-        self.rect = pygame.Rect(0, 0, width, height)
+        self.x = 0.0
+        self.y = 0.0
+        self.width = width
+        self.height = height
+        self.level = ZOOM_LEVELS.index(1.0)
         self.zoom = 1.0
+        self.anchor = None  # (screen position, world position) while zooming
 
     def move(self, dx, dy):
-        self.rect.x += dx
-        self.rect.y += dy
+        self.x += dx
+        self.y += dy
+        if self.anchor:
+            pos, world = self.anchor
+            self.anchor = (pos, (world[0] + dx, world[1] + dy))
+
+    def zoom_at(self, pos, steps):
+        self.level = min(max(self.level + steps, 0), len(ZOOM_LEVELS) - 1)
+        self.anchor = (pos, self.screen_to_world(pos))
+
+    def zoom_in(self, pos):
+        self.zoom_at(pos, 1)
+
+    def zoom_out(self, pos):
+        self.zoom_at(pos, -1)
 
-    def zoom_in(self, factor):
-        self.zoom *= factor
+    def settled(self):
+        return self.zoom == ZOOM_LEVELS[self.level]
 
-    def zoom_out(self, factor):
-        self.zoom /= factor
+    def update(self, dt):
+        if self.settled():
+            self.anchor = None
+            return
+        target = ZOOM_LEVELS[self.level]
+        self.zoom *= (target / self.zoom) ** min(1.0, dt * ZOOM_SPEED)
+        if abs(self.zoom / target - 1) < 0.01:
+            self.zoom = target
+        pos, world = self.anchor
+        self.x = world[0] - pos[0] / self.zoom
+        self.y = world[1] - pos[1] / self.zoom
+
+    def screen_to_world(self, pos):
+        return (pos[0] / self.zoom + self.x, pos[1] / self.zoom + self.y)
+
+def in_canvas(pos):
+    return PREDEFINED_PANEL_WIDTH < pos[0] < WIDTH - PANEL_WIDTH and pos[1] > TOP_PANEL_HEIGHT
+
+def find_port(project, camera, pos):
+    # (node, port, is_output) under a screen position, or None
+    x, y = camera.screen_to_world(pos)
+    for node in project.nodes_in_rect(pygame.Rect(x - 12, y - 12, 24, 24)):
+        port = node.get_output_port(pos, camera)
+        if port is not None:
+            return node, port, True
+        port = node.get_input_port(pos, camera)
+        if port is not None:
+            return node, port, False
+    return None
+
+def can_connect(start, end, blocked=()):
+    # start/end are (node, port, is_output); True if the types fit. blocked
+    # are the nodes that would close a cycle.
+    if end is None or end[0] is start[0] or end[2] == start[2] or end[0] in blocked:
+        return False
+    source, target = (start, end) if start[2] else (end, start)
+    return is_compatible(source[0].output_types[source[1]], target[0].input_types[target[1]])
+
+def draw_node_state(surface, camera, node, state, frame):
+    # Outline with the state of the node in the last run (running ones blink)
+    if state == "running" and frame % 30 >= 15:
+        return
+    outline = pygame.Rect(
+        (node.rect.x - camera.x) * camera.zoom,
+        (node.rect.y - camera.y) * camera.zoom,
+        node.rect.width * camera.zoom,
+        node.rect.height * camera.zoom
+    ).inflate(12, 12)
+    pygame.draw.rect(surface, STATE_COLORS[state], outline, 2, border_radius=int(14 * camera.zoom))
+
+def draw_port_hints(surface, project, camera, start, blocked):
+    # While dragging a wire, ring every port it could go to: green if the types
+    # fit, red if they don't or the wire would close a cycle
+    view = pygame.Rect(camera.x, camera.y, WIDTH / camera.zoom, HEIGHT / camera.zoom)
+    batch = PrimitiveBatch()
+    for node in project.nodes_in_rect(view):
+        if node is start[0]:
+            continue
+        ports = node.inputs if start[2] else node.outputs
+        for port in range(len(ports)):
+            color = COMPATIBLE_COLOR if can_connect(start, (node, port, not start[2]), blocked) else ERROR_COLOR
+            batch.circle(color, node.port_position(port, not start[2], camera), int(12 * camera.zoom), max(1, int(2 * camera.zoom)))
+    batch.flush(surface)
+
+# Ruta ortogonal de un cable (cacheada en el proyecto). New routes are only
+# computed for visible wires and until the frame's time budget runs out; the
+# rest are drawn as curves and routed in the next frames.
+ROUTE_BUDGET_MS = 8
+
+def wire_route(project, connection, view, deadline):
+    start, end = connection.endpoints()
+    route = project.routes.get(connection, start, end)
+    if route is None and time.perf_counter() < deadline and view.colliderect(route_box(start, end)):
+        route = project.routes.compute(connection, start, end, project.obstacles)
+    return route
+
+TRACE_FILE = "my_project.buetrace"  # Written by the runs while tracing is on (T)
+TRACE_SAMPLE_EVERY = 100  # Values kept in the trace: one evaluation in that many
+
+def run_graph(executor, project, order, monitor, trace_path=None, progress=None):
+    # Thread job behind the Run button. The monitor gets every node event
+    # (the main loop draws them); progress() raises JobCancelled once the job
+    # is cancelled, which stops the run at the next node. With trace_path the
+    # run is also recorded there (run_trace.py).
+    total = max(1, len(order))
+    finished = 0
+
+    def listener(event, node, value):
+        nonlocal finished
+        monitor(event, node, value)
+        if event == "done":
+            finished += 1
+            progress(min(1.0, finished / total))
+
+    executor.listener = listener
+    executor.tracer = TraceWriter(trace_path, project, TRACE_SAMPLE_EVERY) if trace_path else None
+    try:
+        return executor.run(project, order=order)
+    finally:
+        if executor.tracer is not None:
+            executor.tracer.close()
+            executor.tracer = None
+        executor.listener = None
+        monitor("stop", None)
+        monitor.running = False
+
+LOCKED_NOTICE_SECONDS = 3  # How long the top panel explains a refused edit
+
+def graph_locked(monitor):
+    # A run walks the live project from its thread: no nodes, ports or wires
+    # change until it ends (its job button cancels it at the next node). The
+    # top panel says so for a moment after an edit is refused.
+    if monitor.running:
+        monitor.refused = time.perf_counter()
+        return True
+    return False
+
+# Datos para layout_graph (se manda a otro proceso, asi que solo numeros)
+def layout_request(project, nodes):
+    nodes = sorted(nodes, key=project.order.position)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(index[c.start_node], index[c.end_node]) for node in nodes for c in project.outgoing(node) if c.end_node in index]
+    sizes = [(node.rect.width, node.rect.height) for node in nodes]
+    return nodes, (sizes, edges, list(range(len(nodes))))
+
+def apply_layout(project, nodes, positions):
+    # The layout keeps the top-left corner of the nodes where it was
+    nodes_positions = [(node, pos) for node, pos in zip(nodes, positions) if project.contains(node)]
+    if not nodes_positions:
+        return None
+    left = min(node.rect.x for node, _ in nodes_positions)
+    top = min(node.rect.y for node, _ in nodes_positions)
+    return project.place_nodes([node for node, _ in nodes_positions],
+                               [(left + x, top + y) for _, (x, y) in nodes_positions])
 
 def create_node(pos, camera, name="Node", color=(100, 100, 255)):
-    x = (pos[0] + camera.rect.x) / camera.zoom
-    y = (pos[1] + camera.rect.y) / camera.zoom
+    x, y = camera.screen_to_world(pos)
     return Node(x, y, 200, 150, name, color)
 
+# Agrupa los nodos seleccionados en un MacroNode. Las conexiones de dentro pasan
+# al Project del macro y las que cruzan el borde se reconectan a sus puertos.
+# Los puertos del macro son los del borde del grupo: las entradas que no vienen
+# de otro nodo del grupo y las salidas que salen del grupo o no van a ninguno.
+def collapse_nodes(project, selection):
+    selected = set(node for node in selection if project.contains(node))
+    if not selected:
+        return None
+    # A path that leaves the group and comes back would be a cycle through the
+    # macro
+    leaving_nodes = [c.end_node for node in selected for c in project.outgoing(node) if c.end_node not in selected]
+    if project.downstream(leaving_nodes) & selected:
+        return None
+    inner_nodes = sorted(selected, key=project._node_index.get)
+    macro = MacroNode(min(node.rect.x for node in inner_nodes), min(node.rect.y for node in inner_nodes), 200, 150)
+
+    inner_connections = []
+    incoming = []
+    outgoing = []
+    for node in inner_nodes:
+        for connection in project.incoming(node):
+            if connection.start_node in selected:
+                inner_connections.append(connection)
+            else:
+                incoming.append(connection)
+        for connection in project.outgoing(node):
+            if connection.end_node not in selected:
+                outgoing.append(connection)
+    project.remove_nodes(inner_nodes)
+
+    for node in inner_nodes:
+        macro.inner.add_node(node)
+    for connection in inner_connections:
+        macro.inner.add_connection(connection)
+
+    fed = set((c.end_node, c.end_port) for c in inner_connections)
+    used = set((c.start_node, c.start_port) for c in inner_connections)
+    leaving = set((c.start_node, c.start_port) for c in outgoing)
+    for node in inner_nodes:
+        for port in range(len(node.inputs)):
+            if (node, port) not in fed:
+                macro.input_map.append((node, port))
+        for port in range(len(node.outputs)):
+            if (node, port) in leaving or (node, port) not in used:
+                macro.output_map.append((node, port))
+    macro.update_ports()
+
+    project.add_node(macro)
+    for connection in incoming:
+        port = macro.input_map.index((connection.end_node, connection.end_port))
+        project.add_connection(Connection(connection.start_node, macro, connection.start_port, port))
+    for connection in outgoing:
+        port = macro.output_map.index((connection.start_node, connection.start_port))
+        project.add_connection(Connection(macro, connection.end_node, port, connection.end_port))
+    return macro
+
+# Al cerrar un macro: los puertos de nodos que se borraron dentro desaparecen,
+# junto con las conexiones de fuera que llegaban a ellos.
+def close_macro(parent, macro):
+    old_inputs = macro.input_map
+    old_outputs = macro.output_map
+    macro.input_map = [port for port in old_inputs if macro.inner.contains(port[0])]
+    macro.output_map = [port for port in old_outputs if macro.inner.contains(port[0])]
+    macro.update_ports()
+    parent.spatial.update([macro])
+    if len(macro.input_map) == len(old_inputs) and len(macro.output_map) == len(old_outputs):
+        parent.revalidate(macro)
+        return
+    for connection in list(parent.incoming(macro)):
+        parent.remove_connection(connection)
+        port = old_inputs[connection.end_port]
+        if port in macro.input_map:
+            parent.add_connection(Connection(connection.start_node, macro, connection.start_port, macro.input_map.index(port)))
+    for connection in list(parent.outgoing(macro)):
+        parent.remove_connection(connection)
+        port = old_outputs[connection.start_port]
+        if port in macro.output_map:
+            parent.add_connection(Connection(macro, connection.end_node, macro.output_map.index(port), connection.end_port))
+
 def load_node_from_file(filename):
-    with open(filename, 'r') as file:
-        data = file.read().split('\n')
-    node_data = {}
-    for line in data:
-        if ':' in line:
-            key, value = line.split(':', 1)
-            node_data[key.strip()] = value.strip()
-    
-    node = Node(0, 0, int(node_data.get('width', 200)), int(node_data.get('height', 150)), node_data.get('name', 'Node'))
-    node.inputs = node_data.get('inputs', '').split(', ')
-    node.outputs = node_data.get('outputs', '').split(', ')
-    node.input_types = node_data.get('input_types', '').split(', ')
-    node.output_types = node_data.get('output_types', '').split(', ')
-    node.symbol = node_data.get('symbol', '')
-    node.description = node_data.get('description', '')
-    node.code = node_data.get('code', '')
-    node.lock = node_data.get('lock', 'false').lower() == 'true'
-    
-    # Parse colors
-    node.color = tuple(map(int, node_data.get('node_color', '100, 100, 255').split(', ')))
-    node.symbol_color = tuple(map(int, node_data.get('symbol_color', '255, 255, 255').split(', ')))
-    node.input_colors = [tuple(map(int, color.split(', '))) for color in node_data.get('input_colors', '').split('; ')]
-    node.output_colors = [tuple(map(int, color.split(', '))) for color in node_data.get('output_colors', '').split('; ')]
-    
+    return node_from_definition(bnode.load(filename))
+
+def load_palette_node(entry):
+    # Reads the full definition only now; the palette is built from the index
+    return node_from_definition(bnode.loads(read_definition(entry.path, entry.offset, entry.length), entry.path))
+
+def node_from_definition(data):
+    node = Node(0, 0, data["width"], data["height"], data["name"], data["node_color"])
+    node.inputs = data["inputs"]
+    node.outputs = data["outputs"]
+    node.input_types = data["input_types"]
+    node.output_types = data["output_types"]
+    node.input_colors = data["input_colors"]
+    node.output_colors = data["output_colors"]
+    node.symbol = data["symbol"]
+    node.symbol_color = data["symbol_color"]
+    node.description = data["description"]
+    node.code = data["code"]
+    node.lock = data["lock"]
+    node.pure = data["pure"]
+    node.compact()
+    node.template = intern_value(node.values())
     return node
 
 def draw_grid(surface, camera):
-    for x in range(0, WIDTH, 50):
+    # Lines every 50 world units over the visible part of the canvas
+    x = math.floor(camera.x / 50) * 50
+    while (x - camera.x) * camera.zoom < WIDTH:
         pygame.draw.line(surface, GRID_COLOR, 
-                         ((x - camera.rect.x) * camera.zoom, 0), 
-                         ((x - camera.rect.x) * camera.zoom, HEIGHT))
-    for y in range(0, HEIGHT, 50):
+                         ((x - camera.x) * camera.zoom, 0), 
+                         ((x - camera.x) * camera.zoom, HEIGHT))
+        x += 50
+    y = math.floor(camera.y / 50) * 50
+    while (y - camera.y) * camera.zoom < HEIGHT:
         pygame.draw.line(surface, GRID_COLOR, 
-                         (0, (y - camera.rect.y) * camera.zoom), 
-                         (WIDTH, (y - camera.rect.y) * camera.zoom))
+                         (0, (y - camera.y) * camera.zoom), 
+                         (WIDTH, (y - camera.y) * camera.zoom))
+        y += 50
+
+# While the zoom animates, the last frame drawn at a zoom level is scaled
+# instead of drawing the nodes at an in-between size; frame is
+# (surface, zoom, x, y) of that frame
+def draw_zoom_frame(surface, camera, frame):
+    image, zoom, x, y = frame
+    scale = camera.zoom / zoom
+    offset = ((x - camera.x) * camera.zoom, (y - camera.y) * camera.zoom)
+    # Only the part of the image that ends up on the screen is scaled
+    source = pygame.Rect(-offset[0] / scale, -offset[1] / scale, WIDTH / scale + 2, HEIGHT / scale + 2).clip(image.get_rect())
+    if source.width and source.height:
+        part = pygame.transform.scale(image.subsurface(source), (math.ceil(source.width * scale), math.ceil(source.height * scale)))
+        surface.blit(part, (offset[0] + source.x * scale, offset[1] + source.y * scale))
 
 # Function to draw the top panel
-def draw_top_panel(surface):
+# Buttons of the top panel (left of the side panel, which covers the right side)
+RUN_BUTTON = pygame.Rect(WIDTH - PANEL_WIDTH - 330, 10, 100, 30)
+SAVE_BUTTON = pygame.Rect(WIDTH - PANEL_WIDTH - 220, 10, 100, 30)
+OPEN_BUTTON = pygame.Rect(WIDTH - PANEL_WIDTH - 110, 10, 100, 30)
+
+# Panel que se dibuja en su propia superficie. draw() only calls the render
+# function again when the key (what the panel shows) changes; the other frames
+# just blit the surface. The render function draws in panel coordinates.
+class CachedPanel:
+    def __init__(self, rect, render):
+        self.rect = pygame.Rect(rect)
+        self.surface = pygame.Surface(self.rect.size)
+        self.render = render
+        self.key = None
+        self.renders = 0
+
+    def draw(self, surface, key, *args):
+        if key != self.key or self.renders == 0:
+            self.key = key
+            self.renders += 1
+            self.render(self.surface, *args)
+        surface.blit(self.surface, self.rect)
+
+def draw_top_panel(surface, title=""):
     pygame.draw.rect(surface, PANEL_BACKGROUND, pygame.Rect(0, 0, WIDTH, TOP_PANEL_HEIGHT))
-    font = pygame.font.Font(None, 24)
+    font = get_font(24)
+
+    if title:
+        title_text = font.render(title, True, PANEL_TEXT_COLOR)
+        surface.blit(title_text, (PREDEFINED_PANEL_WIDTH + 20, 15))
+
+    # Run button
+    pygame.draw.rect(surface, SAVE_BUTTON_COLOR, RUN_BUTTON)
+    run_text = font.render("Run", True, (0, 0, 0))
+    surface.blit(run_text, (RUN_BUTTON.x + 33, RUN_BUTTON.y + 5))
 
     # Save button
-    save_button = pygame.Rect(WIDTH - 220, 10, 100, 30)
-    pygame.draw.rect(surface, SAVE_BUTTON_COLOR, save_button)
+    pygame.draw.rect(surface, SAVE_BUTTON_COLOR, SAVE_BUTTON)
     save_text = font.render("Save", True, (0, 0, 0))
-    surface.blit(save_text, (save_button.x + 30, save_button.y + 5))
+    surface.blit(save_text, (SAVE_BUTTON.x + 30, SAVE_BUTTON.y + 5))
 
     # Open button
-    open_button = pygame.Rect(WIDTH - 110, 10, 100, 30)
-    pygame.draw.rect(surface, SAVE_BUTTON_COLOR, open_button)
+    pygame.draw.rect(surface, SAVE_BUTTON_COLOR, OPEN_BUTTON)
     open_text = font.render("Open", True, (0, 0, 0))
-    surface.blit(open_text, (open_button.x + 30, open_button.y + 5))
+    surface.blit(open_text, (OPEN_BUTTON.x + 30, OPEN_BUTTON.y + 5))
 
-    return save_button, open_button
+# Background jobs: name and progress bar of each one, click to cancel
+JOB_NAMES = {"layout": "Layout", "run": "Run"}
+
+def draw_jobs_indicator(surface, jobs, frame, highlight=None):
+    font = get_font(20)
+    buttons = []
+    x = RUN_BUTTON.x - 10
+    for job in jobs.running.values():
+        x -= 130
+        button = pygame.Rect(x, 12, 120, 26)
+        pygame.draw.rect(surface, BUTTON_COLOR, button)
+        if job.progress > 0:
+            bar = pygame.Rect(button.x, button.bottom - 4, int(button.width * job.progress), 4)
+        else:
+            # No progress reported yet: a block going back and forth
+            offset = abs(frame % 60 - 30) * (button.width - 30) // 30
+            bar = pygame.Rect(button.x + offset, button.bottom - 4, 30, 4)
+        pygame.draw.rect(surface, CONNECTOR_COLOR, bar)
+        if job.kind == highlight:
+            pygame.draw.rect(surface, ERROR_COLOR, button, 2)
+        text = font.render(JOB_NAMES.get(job.kind, job.kind) + "  x", True, PANEL_TEXT_COLOR)
+        surface.blit(text, (button.x + 8, button.y + 5))
+        buttons.append((button, job))
+    return buttons
+
+# Labels of values and errors are cut short before rendering: a text surface is
+# as wide as its text, so the repr of a big output (a list of 100000 items) took
+# hundreds of ms and hundreds of MB on every redraw while a run updates it
+LABEL_CHARS = 60  # The panel shows about half of that anyway
+value_repr = reprlib.Repr()
+value_repr.maxstring = LABEL_CHARS
+value_repr.maxother = LABEL_CHARS
+
+def short_label(text):
+    return text if len(text) <= LABEL_CHARS else text[:LABEL_CHARS - 3] + "..."
 
 # Function to draw the side panel (always visible)
-def draw_side_panel(surface, node):
-    pygame.draw.rect(surface, PANEL_BACKGROUND, pygame.Rect(WIDTH - PANEL_WIDTH, 0, PANEL_WIDTH, HEIGHT))
-    font = pygame.font.Font(None, 24)
+def draw_side_panel(surface, node, monitor=None):
+    pygame.draw.rect(surface, PANEL_BACKGROUND, pygame.Rect(0, 0, PANEL_WIDTH, HEIGHT))
+    font = get_font(24)
 
     if node:
         # titulo
         title = font.render("Node Editor", True, PANEL_TEXT_COLOR)
-        surface.blit(title, (WIDTH - PANEL_WIDTH + 20, 20))
+        surface.blit(title, (20, 20))
         
         # nombre del nodo
         name_text = font.render(f"Name: {node.name}", True, PANEL_TEXT_COLOR)
-        surface.blit(name_text, (WIDTH - PANEL_WIDTH + 20, 60))
+        surface.blit(name_text, (20, 60))
         
         # inputs
         input_title = font.render("Inputs:", True, PANEL_TEXT_COLOR)
-        surface.blit(input_title, (WIDTH - PANEL_WIDTH + 20, 100))
+        surface.blit(input_title, (20, 100))
         for i, input_name in enumerate(node.inputs):
             input_text = font.render(f"{i+1}. {input_name}", True, PANEL_TEXT_COLOR)
-            surface.blit(input_text, (WIDTH - PANEL_WIDTH + 40, 130 + i * 30))
+            surface.blit(input_text, (40, 130 + i * 30))
 
         # outputs
         output_title = font.render("Outputs:", True, PANEL_TEXT_COLOR)
-        surface.blit(output_title, (WIDTH - PANEL_WIDTH + 20, 160 + len(node.inputs) * 30))
+        surface.blit(output_title, (20, 160 + len(node.inputs) * 30))
+        outputs = monitor.outputs.get(node) if monitor else None
         for i, output_name in enumerate(node.outputs):
-            output_text = font.render(f"{i+1}. {output_name}", True, PANEL_TEXT_COLOR)
-            surface.blit(output_text, (WIDTH - PANEL_WIDTH + 40, 190 + len(node.inputs) * 30 + i * 30))
+            label = f"{i+1}. {output_name}"
+            if outputs is not None:
+                label += f" = {value_repr.repr(outputs[i])}"
+            label = short_label(label)
+            output_text = font.render(label, True, PANEL_TEXT_COLOR)
+            surface.blit(output_text, (40, 190 + len(node.inputs) * 30 + i * 30))
+
+        # estado de la ultima ejecucion
+        state = monitor.states.get(node) if monitor else None
+        y = 220 + (len(node.inputs) + len(node.outputs)) * 30
+        if state:
+            label = f"Last run: {state}"
+            if state == "error":
+                label = short_label(f"{label} ({monitor.errors[node]})")
+            state_text = font.render(label, True, STATE_COLORS[state])
+            surface.blit(state_text, (20, y))
+        # valores guardados en la traza que se reproduce
+        sample = monitor.samples.get(node) if monitor else None
+        if sample:
+            for i, (title, text) in enumerate(zip(("In", "Out"), sample)):
+                sample_text = get_font(20).render(f"{title}: {text}", True, PANEL_TEXT_COLOR)
+                surface.blit(sample_text, (20, y + 30 + i * 24))
         
     else:
         # mostrar el select node
         no_node_text = font.render("Select a node to adjust his configuration.", True, PANEL_TEXT_COLOR)
-        surface.blit(no_node_text, (WIDTH - PANEL_WIDTH + 20, 60))
+        surface.blit(no_node_text, (20, 60))
+
+def side_panel_key(node, monitor):
+    # What the side panel shows; the monitor notes when each node changed
+    if node is None:
+        return None
+    return (node, node.name, tuple(node.inputs), tuple(node.outputs), monitor.changed.get(node))
+
+# Estado del panel de los .bnode: busqueda y scroll.
+# Solo se dibujan las filas visibles y cada nombre se renderiza una sola vez.
+class PredefinedPalette:
+    ROW_HEIGHT = 30
+    LIST_TOP = 90
+    SEARCH_BUDGET_MS = 4  # Per frame; a slow search keeps the last results until it ends
+
+    def __init__(self, index):
+        self.index = index
+        self.query = ""
+        self.results = index.search("")
+        self.pending = None  # Search still going on (PaletteIndex.steps)
+        self.scroll = 0
+        self.focused = False
+        self.search_rect = pygame.Rect(10, 50, PREDEFINED_PANEL_WIDTH - 20, 28)
+        self.row_cache = {}
+        self.version = 0  # Changes with the results (the panel is drawn again)
+
+    def set_query(self, query):
+        self.query = query
+        self.pending = self.index.steps(query)
+        self.version += 1  # The search box
+        self.update()
+
+    def update(self):
+        # Goes on with the pending search for up to SEARCH_BUDGET_MS
+        if self.pending is None:
+            return
+        deadline = time.perf_counter() + self.SEARCH_BUDGET_MS / 1000
+        for result in self.pending:
+            if result is not None:
+                self.pending = None
+                self.results = result
+                self.scroll = 0
+                self.version += 1
+                return
+            if time.perf_counter() >= deadline:
+                return
+
+    def max_scroll(self):
+        return max(0, len(self.results) * self.ROW_HEIGHT - (HEIGHT - self.LIST_TOP))
+
+    def scroll_by(self, dy):
+        self.scroll = min(max(0, self.scroll + dy), self.max_scroll())
+
+    def visible_range(self):
+        first = self.scroll // self.ROW_HEIGHT
+        count = (HEIGHT - self.LIST_TOP) // self.ROW_HEIGHT + 2
+        return first, min(len(self.results), first + count)
+
+    def row_at(self, pos):
+        if pos[0] >= PREDEFINED_PANEL_WIDTH or pos[1] < self.LIST_TOP:
+            return None
+        row = (pos[1] - self.LIST_TOP + self.scroll) // self.ROW_HEIGHT
+        if row < len(self.results):
+            return self.index.entries[self.results[row]]
+        return None
+
+    def row_surface(self, entry, font):
+        text = self.row_cache.get(entry.name)
+        if text is None:
+            text = font.render(entry.name, True, PANEL_TEXT_COLOR)
+            self.row_cache[entry.name] = text
+        return text
+
+# Minimapa: una imagen pequena de todo el grafo, cacheada. Only the areas the
+# project reports as changed are redrawn; it is rebuilt when the graph grows
+# out of the area it covers. Drawing it is one blit plus the view outline.
+class Minimap:
+    WIDTH = 240
+    HEIGHT = 150
+
+    def __init__(self):
+        self.rect = pygame.Rect(WIDTH - PANEL_WIDTH - self.WIDTH - 10, HEIGHT - self.HEIGHT - 10, self.WIDTH, self.HEIGHT)
+        self.image = pygame.Surface(self.rect.size)
+        self.project = None
+        self.world = pygame.Rect(0, 0, 1, 1)  # Area of the canvas in the image
+        self.scale = 1.0
+
+    def to_image(self, rect):
+        return pygame.Rect(
+            (rect.x - self.world.x) * self.scale,
+            (rect.y - self.world.y) * self.scale,
+            max(1, rect.width * self.scale),
+            max(1, rect.height * self.scale)
+        )
+
+    def to_world(self, pos):
+        return (self.world.x + (pos[0] - self.rect.x) / self.scale,
+                self.world.y + (pos[1] - self.rect.y) / self.scale)
+
+    def rebuild(self, project):
+        self.project = project
+        project.take_dirty()
+        if project.nodes:
+            bounds = pygame.Rect(project.nodes[0].rect).unionall([node.rect for node in project.nodes])
+        else:
+            bounds = pygame.Rect(0, 0, WIDTH, HEIGHT)
+        # Room to grow, so moving nodes near the edge doesn't rebuild every time
+        bounds.inflate_ip(bounds.width // 2 + 200, bounds.height // 2 + 200)
+        self.scale = min(self.WIDTH / bounds.width, self.HEIGHT / bounds.height)
+        self.world = pygame.Rect(0, 0, self.WIDTH / self.scale, self.HEIGHT / self.scale)
+        self.world.center = bounds.center
+        self.image.fill(PANEL_BACKGROUND)
+        for node in project.nodes:
+            pygame.draw.rect(self.image, node.color, self.to_image(node.rect))
+
+    def update(self, project):
+        if project is not self.project:
+            self.rebuild(project)
+            return
+        dirty = project.take_dirty()
+        if dirty is None or any(not self.world.contains(rect) for rect in dirty):
+            self.rebuild(project)
+            return
+        for rect in dirty:
+            area = self.to_image(rect).inflate(2, 2)
+            self.image.fill(PANEL_BACKGROUND, area)
+            self.image.set_clip(area)
+            for node in project.nodes_in_rect(rect.inflate(2 / self.scale, 2 / self.scale)):
+                pygame.draw.rect(self.image, node.color, self.to_image(node.rect))
+            self.image.set_clip(None)
+
+    def draw(self, surface, camera):
+        surface.blit(self.image, self.rect)
+        view = self.to_image(pygame.Rect(camera.x, camera.y, WIDTH / camera.zoom, HEIGHT / camera.zoom))
+        pygame.draw.rect(surface, SELECTION_COLOR, view.move(self.rect.topleft).clip(self.rect), 1)
+        pygame.draw.rect(surface, NODE_OUTLINE, self.rect, 1)
+
+    def center_camera(self, camera, pos):
+        # Puts the point of the canvas under pos in the middle of the canvas
+        x, y = self.to_world(pos)
+        camera.move(x - (PREDEFINED_PANEL_WIDTH + (WIDTH - PANEL_WIDTH - PREDEFINED_PANEL_WIDTH) / 2) / camera.zoom - camera.x,
+                    y - (TOP_PANEL_HEIGHT + (HEIGHT - TOP_PANEL_HEIGHT) / 2) / camera.zoom - camera.y)
+
+# Reproduccion de una traza sobre el proyecto: a bar under the canvas scrubs
+# through the recorded run and the nodes show their state at that moment.
+REPLAY_BAR = pygame.Rect(PREDEFINED_PANEL_WIDTH + 10, HEIGHT - 40, WIDTH - PANEL_WIDTH - Minimap.WIDTH - PREDEFINED_PANEL_WIDTH - 30, 30)
+REPLAY_TRACK = pygame.Rect(REPLAY_BAR.x + 230, REPLAY_BAR.centery - 3, REPLAY_BAR.width - 240, 6)
+
+def load_replay(project, filename):
+    # (Replay, {trace node id: node}); traced nodes that aren't in the project
+    # any more (path or name changed) are left out
+    trace = read_trace(filename)
+    nodes = {}
+    for node_id, (path, name) in trace.nodes.items():
+        node = resolve_path(project, path)
+        if node is not None and node.name == name:
+            nodes[node_id] = node
+    if len(nodes) < len(trace.nodes):
+        print(f"{filename}: {len(trace.nodes) - len(nodes)} traced nodes are not in the project")
+    return Replay(trace), nodes
+
+def show_replay(monitor, replay, nodes, t):
+    states, errors, samples = {}, {}, {}
+    for node_id, (state, evaluation) in replay.at(t).items():
+        node = nodes.get(node_id)
+        if node is None:
+            continue
+        states[node] = state
+        sample = replay.last_sample(node_id, t)
+        if sample is not None:
+            samples[node] = sample
+        if state == "error":
+            errors[node] = evaluation.sample[1] if evaluation.sample else "error"
+    monitor.show(states, errors, samples)
+
+def replay_time_at(replay, x):
+    fraction = min(max((x - REPLAY_TRACK.x) / REPLAY_TRACK.width, 0.0), 1.0)
+    return fraction * replay.trace.duration
+
+def draw_replay_bar(surface, replay, t):
+    pygame.draw.rect(surface, PANEL_BACKGROUND, REPLAY_BAR)
+    pygame.draw.rect(surface, NODE_OUTLINE, REPLAY_BAR, 1)
+    duration = replay.trace.duration
+    label = get_font(20).render(f"Trace {t * 1000:.2f} / {duration * 1000:.2f} ms", True, PANEL_TEXT_COLOR)
+    surface.blit(label, (REPLAY_BAR.x + 10, REPLAY_BAR.y + 8))
+    pygame.draw.rect(surface, BUTTON_COLOR, REPLAY_TRACK)
+    cursor = REPLAY_TRACK.x + (REPLAY_TRACK.width * t / duration if duration else 0)
+    pygame.draw.rect(surface, CONNECTOR_COLOR, (REPLAY_TRACK.x, REPLAY_TRACK.y, cursor - REPLAY_TRACK.x, REPLAY_TRACK.height))
+    pygame.draw.line(surface, SELECTION_COLOR, (cursor, REPLAY_BAR.y + 4), (cursor, REPLAY_BAR.bottom - 4), 2)
 
 # funcion para dibujar el panel de los .bnode
-def draw_predefined_panel(surface, predefined_nodes):
+def draw_predefined_panel(surface, palette):
     pygame.draw.rect(surface, PANEL_BACKGROUND, pygame.Rect(0, 0, PREDEFINED_PANEL_WIDTH, HEIGHT))
-    font = pygame.font.Font(None, 24)
+    font = get_font(24)
 
     title = font.render("Predefined Nodes", True, PANEL_TEXT_COLOR)
     surface.blit(title, (20, 20))
 
-    if not predefined_nodes:
+    # Search box
+    pygame.draw.rect(surface, BUTTON_HOVER_COLOR if palette.focused else BUTTON_COLOR, palette.search_rect)
+    search_text = font.render(palette.query or "Search...", True, PANEL_TEXT_COLOR if palette.query else NODE_OUTLINE)
+    surface.blit(search_text, (palette.search_rect.x + 5, palette.search_rect.y + 6))
+
+    if not palette.results:
         no_node_text = font.render("No nodes", True, PANEL_TEXT_COLOR)
-        surface.blit(no_node_text, (20, 60))
-    else:
-        for i, node_name in enumerate(predefined_nodes):
-            node_text = font.render(node_name, True, PANEL_TEXT_COLOR)
-            surface.blit(node_text, (20, 60 + i * 30))
+        surface.blit(no_node_text, (20, palette.LIST_TOP))
+        return
+
+    list_clip = pygame.Rect(0, palette.LIST_TOP, PREDEFINED_PANEL_WIDTH, HEIGHT - palette.LIST_TOP)
+    previous_clip = surface.get_clip()
+    surface.set_clip(list_clip)
+    first, last = palette.visible_range()
+    for row in range(first, last):
+        entry = palette.index.entries[palette.results[row]]
+        y = palette.LIST_TOP + row * palette.ROW_HEIGHT - palette.scroll
+        surface.blit(palette.row_surface(entry, font), (20, y))
+    surface.set_clip(previous_clip)
 
-# esto es lo que carga los nodos de nodes/
+# esto es lo que carga los nodos de nodes/ (carpetas y .bpack, desde el indice)
 def load_predefined_nodes(folder="nodes"):
-    if not os.path.exists(folder):
-        return []
-    return [f.replace(".bnode", "") for f in os.listdir(folder) if f.endswith(".bnode")]
+    index = PaletteIndex()
+    for node in load_library(folder):
+        name = f"{node['category']}/{node['name']}" if node["category"] else node["name"]
+        index.add(PaletteEntry(name, node["description"], node["input_types"], node["output_types"],
+                               node["path"], node["offset"], node["length"]))
+    return index
+
+# Sesion: al cerrar se guarda la camara, el proyecto y la paleta (session_cache.py)
+PROJECT_FILE = "my_project.buepyt"
+SESSION_MODULES = ("spatial", "topo_order", "palette", "bnode_pack", "session_cache")  # Their code shapes what is cached
+
+def session_key():
+    return code_key([os.path.abspath(__file__)] + [sys.modules[name].__file__ for name in SESSION_MODULES])
+
+def restore_palette(cached, folder="nodes"):
+    # The palette of the last session while the library is the same, else built from the library
+    stats, files = library_signature(folder)
+    if cached is not None and cached["stats"] == stats and set(cached["files"]) == set(files) and unchanged(cached["files"]):
+        return PaletteIndex.from_state(cached["palette"])
+    return load_predefined_nodes(folder)
+
+def palette_session(index, folder="nodes"):
+    stats, files = library_signature(folder)
+    return {"stats": stats, "files": file_hashes(files), "palette": index.state()}
+
+def reopen_project(cached):
+    # (project, its session entry): the last project of the session, from its
+    # snapshot while the file is unchanged and from the file otherwise
+    project = Project()
+    if cached is None:
+        return project, None
+    # Tens of thousands of new objects at once: the garbage collector running
+    # in between took most of the time with big projects
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        snapshot = project_snapshot(cached)
+        if snapshot is not None:
+            project.from_snapshot(snapshot)
+            return project, cached
+    finally:
+        if collecting:
+            gc.enable()
+    try:
+        project.load(cached["file"])
+    except (OSError, ValueError, KeyError, IndexError) as error:  # CycleError and bad JSON are ValueErrors
+        print(f"{cached['file']}: {error}")
+        return Project(), None
+    return project, project_entry(cached["file"], project.to_snapshot())
 
 # Main loop and event handling
-nodes = []
-connections = []
-camera = Camera(WIDTH, HEIGHT)
-selected_node = None
-dragging_node = None
-dragging_offset = (0, 0)
-dragging_predefined = None  # To track dragging predefined nodes
-project = Project()
-
-predefined_nodes = load_predefined_nodes()
-
-while True:
-    screen.fill(BACKGROUND)
-    
-    # Grid
-    draw_grid(screen, camera)
+if __name__ == "__main__":
+    # Worker processes (layout) import this file again on Windows and in the
+    # frozen .exe; only the real program opens the window
+    multiprocessing.freeze_support()
+    startup_time = "--startup-time" in sys.argv  # Print how long startup took and quit (benchmarks/bench_startup.py)
+    use_session = "--no-session" not in sys.argv  # Start empty and don't write SESSION_FILE
+    main_started = time.perf_counter()
+    # Only what the IDE uses: pygame.init() also starts sound, joysticks, etc.
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("BUE IDE v3.5")
+
+    session = load_session(SESSION_FILE, session_key()) if use_session else None
+    camera = Camera(WIDTH, HEIGHT)
+    if session:
+        camera.x, camera.y, camera.level = session["camera"]
+        camera.zoom = ZOOM_LEVELS[camera.level]
+    selected_node = None  # The one shown in the side panel
+    selection = set()
+    selection_start = None  # Screen position where a rubber band selection started
+    click_pos = None
+    connecting = None  # (node, port, is_output) where the wire being dragged starts
+    connect_blocked = set()  # Nodes the wire being dragged can't go to (cycles)
+    dragging_node = None
+    dragging_offset = (0, 0)
+    dragging_predefined = None  # To track dragging predefined nodes
+    preview_node = None
+    root_project, session_project = reopen_project(session and session["project"])
+    project = root_project  # Project shown on the canvas (the root or an open macro)
+    open_macros = []  # (macro, parent project) for every macro opened from the root
+    executor = Executor(SandboxPool())  # Node code runs in worker processes, started on the first run
+    monitor = RunMonitor()  # States and outputs of the last run, as it goes
+    tracing = False  # T: runs are recorded into TRACE_FILE
+    replay = None  # R: trace being replayed on the canvas
+    replay_nodes = {}
+    replay_time = 0.0
+    replay_shown = None  # Time the monitor shows
+    replay_drag = False
+    jobs = JobRunner()
+    orthogonal_wires = False  # W switches between curves and routed wires
+    minimap = Minimap()
+    clock = pygame.time.Clock()
+    batch = PrimitiveBatch()
+    zoom_frame = None  # Frame scaled while the zoom animates (see draw_zoom_frame)
+    minimap_drag = False
+    frame = 0
+
+    palette = PredefinedPalette(restore_palette(session and session["library"]))
+    session = None
+    # Panels are only drawn again when what they show changes
+    top_panel = CachedPanel((0, 0, WIDTH - PANEL_WIDTH, TOP_PANEL_HEIGHT), draw_top_panel)
+    side_panel = CachedPanel((WIDTH - PANEL_WIDTH, 0, PANEL_WIDTH, HEIGHT), draw_side_panel)
+    predefined_panel = CachedPanel((0, 0, PREDEFINED_PANEL_WIDTH, HEIGHT), draw_predefined_panel)
 
-    # Top panel
-    save_button, open_button = draw_top_panel(screen)
+    loop_started = time.perf_counter()
+    while True:
+        dt = clock.tick(60) / 1000
+        now = time.perf_counter()
+        monitor.update(now)  # Everything the running graph did since the last frame
+        palette.update()
+        if replay is not None and replay_shown != replay_time:
+            show_replay(monitor, replay, replay_nodes, replay_time)
+            replay_shown = replay_time
+        screen.fill(BACKGROUND)
     
-    # Side panel
-    draw_side_panel(screen, selected_node)
+        # Grid
+        draw_grid(screen, camera)
 
-    # Predefined nodes panel
-    draw_predefined_panel(screen, predefined_nodes)
+        if camera.settled() or zoom_frame is None:
+            # Nodes (the port circles and the wires are drawn together by the batch)
+            view = pygame.Rect(camera.x, camera.y, WIDTH / camera.zoom, HEIGHT / camera.zoom)
+            for node in project.visible_nodes(view):
+                node.draw(screen, camera, batch=batch)
+                if node in monitor.states:
+                    draw_node_state(screen, camera, node, monitor.states[node], frame)
+            for node in selection:
+                outline = pygame.Rect(
+                    (node.rect.x - camera.x) * camera.zoom,
+                    (node.rect.y - camera.y) * camera.zoom,
+                    node.rect.width * camera.zoom,
+                    node.rect.height * camera.zoom
+                ).inflate(6, 6)
+                pygame.draw.rect(screen, SELECTION_COLOR, outline, 2, border_radius=int(12 * camera.zoom))
     
-    # Nodes
-    for node in nodes:
-        node.draw(screen, camera)
+            # Connections (the ones of the selected nodes on top, highlighted)
+            route_deadline = time.perf_counter() + ROUTE_BUDGET_MS / 1000 if orthogonal_wires else 0
+            for connection in project.connections:
+                route = wire_route(project, connection, view, route_deadline) if orthogonal_wires else None
+                connection.draw(screen, camera, ERROR_COLOR if connection in project.type_errors else CONNECTOR_COLOR, route, batch,
+                                monitor.flow(connection, now))
+            for node in selection:
+                for connection in project.incoming(node) + project.outgoing(node):
+                    route = project.routes.get(connection, *connection.endpoints()) if orthogonal_wires else None
+                    connection.draw(screen, camera, SELECTION_COLOR, route, batch)
+            batch.flush(screen)
+
+            # A zoom just started: this frame is the one scaled until it settles
+            zoom_frame = None if camera.settled() else (screen.copy(), camera.zoom, camera.x, camera.y)
+        else:
+            draw_zoom_frame(screen, camera, zoom_frame)
+        camera.update(dt)
+
+        # Minimap
+        minimap.update(project)
+        minimap.draw(screen, camera)
+        if replay is not None:
+            draw_replay_bar(screen, replay, replay_time)
+
+        # Top panel
+        title = " > ".join(macro.name for macro, _ in open_macros) + " (Esc to close)" if open_macros else ""
+        if tracing:
+            title = (title + "    " if title else "") + "Tracing runs (T)"
+        locked_notice = monitor.running and monitor.refused is not None and now - monitor.refused < LOCKED_NOTICE_SECONDS
+        if locked_notice:
+            title = (title + "    " if title else "") + "Locked while running (x cancels)"
+        top_panel.draw(screen, title, title)
+        job_buttons = draw_jobs_indicator(screen, jobs, frame, "run" if locked_notice else None)
+        frame += 1
     
-    # Connections
-    for connection in connections:
-        connection.draw(screen, camera)
+        # Side panel
+        side_panel.draw(screen, side_panel_key(selected_node, monitor), selected_node, monitor)
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1:  # Left click
-                if save_button.collidepoint(event.pos):
-                    project.save("my_project.buepyt")
-                elif open_button.collidepoint(event.pos):
-                    project.load("my_project.buepyt")
-                else:
-                    for node in nodes:
-                        if node.is_over(event.pos, camera):
-                            selected_node = node
-                            dragging_node = node
-                            dragging_offset = (
-                                node.rect.x - (event.pos[0] + camera.rect.x) / camera.zoom,
-                                node.rect.y - (event.pos[1] + camera.rect.y) / camera.zoom
-                            )
-                            break
-                    # Check if clicking on a predefined node
-                    for i, node_name in enumerate(predefined_nodes):
-                        if pygame.Rect(20, 60 + i * 30, 160, 30).collidepoint(event.pos):
-                            dragging_predefined = node_name
-                            break
-            elif event.button == 3:  # Right click
-                pass  # Implement context menu here
-        elif event.type == pygame.MOUSEBUTTONUP:
-            if event.button == 1:  # Left click release
-                if dragging_predefined:
-                    # Create a new node at the mouse position (outside of the panels)
-                    if event.pos[0] > PREDEFINED_PANEL_WIDTH and event.pos[0] < WIDTH - PANEL_WIDTH and event.pos[1] > TOP_PANEL_HEIGHT:
-                        node_file = os.path.join("nodes", f"{dragging_predefined}.bnode")
-                        if os.path.exists(node_file):
-                            new_node = load_node_from_file(node_file)
-                            new_node.rect.x = (event.pos[0] + camera.rect.x) / camera.zoom
-                            new_node.rect.y = (event.pos[1] + camera.rect.y) / camera.zoom
-                            nodes.append(new_node)
-                    dragging_predefined = None
-                dragging_node = None
-        elif event.type == pygame.MOUSEMOTION:
-            if dragging_node:
-                dragging_node.move(
-                    (event.pos[0] + camera.rect.x) / camera.zoom - dragging_node.rect.x - dragging_offset[0],
-                    (event.pos[1] + camera.rect.y) / camera.zoom - dragging_node.rect.y - dragging_offset[1]
-                )
-            elif pygame.mouse.get_pressed()[0] and dragging_predefined is None:  # Left mouse button held down
-                camera.move(-event.rel[0] / camera.zoom, -event.rel[1] / camera.zoom)
-
-    # Draw transparent preview of the node being dragged
-    if dragging_predefined:
-        node_file = os.path.join("nodes", f"{dragging_predefined}.bnode")
-        if os.path.exists(node_file):
-            preview_node = load_node_from_file(node_file)
-            preview_node.rect.x = pygame.mouse.get_pos()[0]
-            preview_node.rect.y = pygame.mouse.get_pos()[1]
+        # Predefined nodes panel
+        predefined_panel.draw(screen, (palette.version, palette.scroll, palette.focused), palette)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                if use_session:
+                    save_session(SESSION_FILE, session_key(), {"camera": (camera.x, camera.y, camera.level),
+                                                               "project": session_project, "library": palette_session(palette.index)})
+                jobs.shutdown()  # Also waits for a run to stop before its pool closes
+                executor.pool.close()
+                pygame.quit()
+                sys.exit()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:  # Left click
+                    palette.focused = palette.search_rect.collidepoint(event.pos)
+                    clicked_job = next((job for button, job in job_buttons if button.collidepoint(event.pos)), None)
+                    if clicked_job is not None:
+                        jobs.cancel(clicked_job)
+                    elif replay is not None and REPLAY_BAR.collidepoint(event.pos):
+                        replay_time = replay_time_at(replay, event.pos[0])
+                        replay_drag = True
+                    elif minimap.rect.collidepoint(event.pos):
+                        minimap.center_camera(camera, event.pos)
+                        minimap_drag = True
+                    elif RUN_BUTTON.collidepoint(event.pos):
+                        # The graph runs in a thread and the canvas shows it as it goes
+                        if not monitor.running:
+                            replay = None
+                            monitor.reset()
+                            monitor.running = True
+                            jobs.submit("run", run_graph, executor, root_project, root_project.evaluation_order(), monitor,
+                                        TRACE_FILE if tracing else None, process=False)
+                    elif SAVE_BUTTON.collidepoint(event.pos):
+                        root_project.save(PROJECT_FILE)
+                        session_project = project_entry(PROJECT_FILE, root_project.to_snapshot())
+                    elif OPEN_BUTTON.collidepoint(event.pos) and graph_locked(monitor):
+                        pass  # Loading would rebuild the project the run is going through
+                    elif OPEN_BUTTON.collidepoint(event.pos):
+                        # Read into a new project: a file that can't be loaded leaves the open one as it was
+                        opened = Project()
+                        try:
+                            opened.load(PROJECT_FILE)
+                        except (OSError, ValueError, KeyError, IndexError) as error:  # CycleError and bad JSON are ValueErrors
+                            print(f"{PROJECT_FILE}: {error}")
+                        else:
+                            root_project = opened
+                            session_project = project_entry(PROJECT_FILE, root_project.to_snapshot())
+                            project = root_project
+                            open_macros = []
+                            selected_node = None
+                            selection = set()
+                            jobs.cancel_all()
+                            replay = None
+                            monitor.reset()
+                    else:
+                        shift = pygame.key.get_mods() & pygame.KMOD_SHIFT
+                        port = find_port(project, camera, event.pos)
+                        node = project.node_at(camera.screen_to_world(event.pos))
+                        if port is not None:
+                            connecting = port
+                            connect_blocked = project.upstream([port[0]]) if port[2] else project.downstream([port[0]])
+                        elif node is not None:
+                            if shift and node in selection:
+                                selection.discard(node)
+                                if selected_node is node:
+                                    selected_node = None
+                            else:
+                                if not shift and node not in selection:
+                                    selection = set()
+                                selection.add(node)
+                                selected_node = node
+                                dragging_node = node
+                                world = camera.screen_to_world(event.pos)
+                                dragging_offset = (node.rect.x - world[0], node.rect.y - world[1])
+                        elif in_canvas(event.pos):
+                            if shift:
+                                selection_start = event.pos
+                            else:
+                                click_pos = event.pos
+                        # Check if clicking on a predefined node
+                        entry = palette.row_at(event.pos)
+                        if entry is not None and os.path.exists(entry.path):
+                            try:
+                                preview_node = load_palette_node(entry)
+                                dragging_predefined = entry
+                            except bnode.BnodeError as error:
+                                print(error)
+                elif event.button == 3:  # Right click
+                    pass  # Implement context menu here
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:  # Left click release
+                    if dragging_predefined:
+                        # Create a new node at the mouse position (outside of the panels)
+                        if (event.pos[0] > PREDEFINED_PANEL_WIDTH and event.pos[0] < WIDTH - PANEL_WIDTH and event.pos[1] > TOP_PANEL_HEIGHT
+                                and not graph_locked(monitor)):
+                            try:
+                                new_node = load_palette_node(dragging_predefined)
+                                new_node.rect.topleft = camera.screen_to_world(event.pos)
+                                project.add_node(new_node)
+                            except bnode.BnodeError as error:
+                                print(error)
+                        dragging_predefined = None
+                        preview_node = None
+                    if connecting:
+                        end = find_port(project, camera, event.pos)
+                        if can_connect(connecting, end, connect_blocked) and not graph_locked(monitor):
+                            source, target = (connecting, end) if connecting[2] else (end, connecting)
+                            project.connect(source[0], source[1], target[0], target[1])
+                        connecting = None
+                    elif selection_start:
+                        # Rubber band: add every node inside the rectangle
+                        start = camera.screen_to_world(selection_start)
+                        end = camera.screen_to_world(event.pos)
+                        band = pygame.Rect(min(start[0], end[0]), min(start[1], end[1]), abs(end[0] - start[0]), abs(end[1] - start[1]))
+                        selection.update(project.nodes_in_rect(band))
+                        selection_start = None
+                    elif click_pos and abs(event.pos[0] - click_pos[0]) + abs(event.pos[1] - click_pos[1]) < 4:
+                        # Click on empty canvas (not a pan)
+                        selection = set()
+                        selected_node = None
+                    click_pos = None
+                    dragging_node = None
+                    minimap_drag = False
+                    replay_drag = False
+            elif event.type == pygame.MOUSEWHEEL:
+                if pygame.mouse.get_pos()[0] < PREDEFINED_PANEL_WIDTH:
+                    palette.scroll_by(-event.y * palette.ROW_HEIGHT)
+                elif in_canvas(pygame.mouse.get_pos()):
+                    camera.zoom_at(pygame.mouse.get_pos(), event.y)
+            elif event.type == pygame.TEXTINPUT:
+                if palette.focused:
+                    palette.set_query(palette.query + event.text)
+            elif event.type == pygame.KEYDOWN:
+                if palette.focused:
+                    if event.key == pygame.K_BACKSPACE:
+                        palette.set_query(palette.query[:-1])
+                    elif event.key == pygame.K_ESCAPE:
+                        palette.set_query("")
+                        palette.focused = False
+                elif event.key == pygame.K_g and selection and not graph_locked(monitor):
+                    # Collapse the selection into a macro
+                    macro = collapse_nodes(project, selection)
+                    if macro is None:
+                        print("Can't group these nodes: a path leaves the group and comes back")
+                    else:
+                        selected_node = macro
+                        selection = {macro}
+                elif event.key == pygame.K_l:
+                    # Auto-layout of the selection (or the whole graph) in a worker process
+                    layout_nodes, request = layout_request(project, selection if len(selection) > 1 else project.nodes)
+                    jobs.submit("layout", layout_graph, *request, data=(project, layout_nodes))
+                elif event.key == pygame.K_w:
+                    orthogonal_wires = not orthogonal_wires
+                elif event.key == pygame.K_t:
+                    tracing = not tracing
+                elif event.key == pygame.K_r:
+                    # Replay the trace of the last traced run (R again to stop)
+                    if replay is not None:
+                        replay = None
+                        monitor.reset()
+                    elif not monitor.running:
+                        try:
+                            replay, replay_nodes = load_replay(root_project, TRACE_FILE)
+                            replay_time = 0.0
+                            replay_shown = None
+                            monitor.reset()
+                        except (OSError, TraceError) as error:
+                            print(error)
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT) and replay is not None:
+                    step = replay.trace.duration / 100
+                    replay_time = min(max(replay_time + (step if event.key == pygame.K_RIGHT else -step), 0.0), replay.trace.duration)
+                elif event.key == pygame.K_DELETE and selection and not graph_locked(monitor):
+                    project.remove_nodes(list(selection))
+                    selection = set()
+                    selected_node = None
+                    dragging_node = None
+                elif event.key == pygame.K_RETURN and isinstance(selected_node, MacroNode):
+                    open_macros.append((selected_node, project))
+                    project = selected_node.inner
+                    selected_node = None
+                    selection = set()
+                elif event.key == pygame.K_ESCAPE and open_macros and not graph_locked(monitor):
+                    macro, project = open_macros.pop()
+                    close_macro(project, macro)
+                    selected_node = macro
+                    selection = {macro}
+            elif event.type == pygame.MOUSEMOTION:
+                if replay_drag:
+                    replay_time = replay_time_at(replay, event.pos[0])
+                elif minimap_drag:
+                    minimap.center_camera(camera, (min(max(event.pos[0], minimap.rect.left), minimap.rect.right),
+                                                   min(max(event.pos[1], minimap.rect.top), minimap.rect.bottom)))
+                elif dragging_node:
+                    # The whole selection moves with the node under the mouse
+                    world = camera.screen_to_world(event.pos)
+                    project.move_nodes(
+                        list(selection),
+                        world[0] + dragging_offset[0] - dragging_node.rect.x,
+                        world[1] + dragging_offset[1] - dragging_node.rect.y
+                    )
+                elif pygame.mouse.get_pressed()[0] and dragging_predefined is None and selection_start is None and connecting is None:  # Left mouse button held down
+                    camera.move(-event.rel[0] / camera.zoom, -event.rel[1] / camera.zoom)
+
+        # Finished background jobs
+        for job in jobs.poll():
+            if job.error is not None:
+                print(f"{JOB_NAMES.get(job.kind, job.kind)} failed: {job.error}")
+                if isinstance(job.error, ExecutionError):
+                    monitor.fail(job.error.node, job.error.message, now)
+            elif job.kind == "run":
+                monitor.finish(job.result, now)
+            elif job.kind == "layout":
+                # Move all the nodes at once
+                apply_layout(job.data[0], job.data[1], job.result)
+
+        # Wire being dragged
+        if connecting:
+            draw_port_hints(screen, project, camera, connecting, connect_blocked)
+            start_pos = connecting[0].port_position(connecting[1], connecting[2], camera)
+            pygame.draw.line(screen, CONNECTOR_COLOR, start_pos, pygame.mouse.get_pos(), 2)
+
+        # Rubber band selection
+        if selection_start:
+            mouse = pygame.mouse.get_pos()
+            band = pygame.Rect(min(selection_start[0], mouse[0]), min(selection_start[1], mouse[1]),
+                               abs(mouse[0] - selection_start[0]), abs(mouse[1] - selection_start[1]))
+            pygame.draw.rect(screen, SELECTION_COLOR, band, 1)
+
+        # Draw transparent preview of the node being dragged
+        if preview_node:
+            preview_node.rect.topleft = camera.screen_to_world(pygame.mouse.get_pos())
             preview_node.draw(screen, camera, transparency=True)
 
-    pygame.display.flip()
\ No newline at end of file
+        pygame.display.flip()
+        if startup_time:
+            shown = time.perf_counter()
+            print(f"imports {(main_started - STARTED) * 1000:.1f} ms, init {(loop_started - main_started) * 1000:.1f} ms, "
+                  f"first frame {(shown - loop_started) * 1000:.1f} ms, total {(shown - STARTED) * 1000:.1f} ms")
+            pygame.quit()
+            sys.exit()
\ No newline at end of file
@@ -0,0 +1,201 @@
+# Cuanto cuesta el codigo de un .bnode.
+#
+#   python bue-bench.py nodes/suma.bnode [more.bnode ...] [--save] [--baseline FILE]
+#
+# The code of every definition is compiled as the executor does, fed with
+# random inputs made from its input_types and called over and over (after a
+# warmup, best of --repeat rounds, like timeit). Reported per node:
+#   - calls per second (the loop and call overhead included; the same numbers
+#     for an empty node are printed first for reference)
+#   - peak memory of one call (tracemalloc) and memory blocks still allocated
+#     per call after the loop (anything above 0 is a cache or a leak)
+# Results are compared with the baseline file (bench_baseline.json next to the
+# first .bnode unless --baseline says otherwise); --save writes them there
+# instead. The exit code is 1 if a node got slower or allocates more than the
+# baseline allows (--tolerance), 2 if a definition can't be loaded or run.
+#
+# Generated inputs per type: int, float/number, bool, str, and list/tuple/set/
+# dict of --size items (list[float] etc. use the element type; dicts have str
+# keys). Any, unions and unknown types get ints (the first known option of a
+# union is used).
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import bnode
+from executor import ExecutionError, compile_node
+from port_types import _parse, _split_union
+
+INPUT_SETS = 64  # Different inputs the calls go through
+DEFAULT_BASELINE = "bench_baseline.json"
+
+
+def make_value(type_name, rng, size):
+    options = [_parse(option) for option in _split_union(type_name)]
+    for base, argument in options:
+        element = lambda: make_value(argument or "int", rng, size)
+        if base == "int":
+            return rng.randint(-1000, 1000)
+        if base in ("float", "number"):
+            return rng.uniform(-1000, 1000)
+        if base == "bool":
+            return rng.random() < 0.5
+        if base == "str":
+            return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(1, 16)))
+        if base == "list":
+            return [element() for _ in range(size)]
+        if base == "tuple":
+            return tuple(element() for _ in range(size))
+        if base == "set":
+            return {element() for _ in range(size)}
+        if base == "dict":
+            return {f"k{i}": element() for i in range(size)}
+    return rng.randint(-1000, 1000)
+
+
+def make_inputs(input_types, seed=1, size=100):
+    rng = random.Random(seed)
+    return [tuple(make_value(type_name, rng, size) for type_name in input_types) for _ in range(INPUT_SETS)]
+
+
+def _loop(function, batch):
+    start = time.perf_counter()
+    for args in batch:
+        function(*args)
+    return time.perf_counter() - start
+
+
+def measure(function, inputs, repeat=5, warmup=0.2, number=None):
+    # (best seconds per call, calls per round); number=None picks it so a
+    # round takes about 0.2 s
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = time.perf_counter() + warmup
+        while time.perf_counter() < deadline:
+            _loop(function, inputs)
+        if number is None:
+            number = len(inputs)
+            while _loop(function, inputs * (number // len(inputs))) < 0.2 and number < 10 ** 8:
+                number *= 2
+        batch = (inputs * (number // len(inputs) + 1))[:number]
+        best = min(_loop(function, batch) for _ in range(repeat))
+    finally:
+        if collecting:
+            gc.enable()
+    return best / number, number
+
+
+def memory(function, inputs, calls=1000):
+    # (peak bytes of one call, blocks kept per call)
+    tracemalloc.start()
+    try:
+        peak = 0
+        for args in inputs[:16]:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function(*args)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for i in range(calls):
+        function(*inputs[i % len(inputs)])
+    gc.collect()
+    return peak, (sys.getallocatedblocks() - blocks) / calls
+
+
+def load_node(path):
+    data = bnode.load(path)
+    node = SimpleNamespace(name=data["name"], inputs=data["inputs"], code=data["code"])
+    return data, compile_node(node)
+
+
+def bench_node(path, args):
+    data, function = load_node(path)
+    inputs = make_inputs(data["input_types"], args.seed, args.size)
+    function(*inputs[0])  # Errors show up here, before timing
+    seconds, number = measure(function, inputs, args.repeat, args.warmup, args.number)
+    peak, kept = memory(function, inputs)
+    return {"name": data["name"], "ops": 1 / seconds, "ns": seconds * 1e9, "calls": number,
+            "peak_bytes": peak, "blocks_per_call": kept}
+
+
+def compare(result, baseline, tolerance):
+    # Problems of a result against its baseline entry
+    problems = []
+    if result["ops"] < baseline["ops"] * (1 - tolerance):
+        problems.append(f"slower: {result['ops']:,.0f} ops/s, baseline {baseline['ops']:,.0f}")
+    if result["peak_bytes"] > baseline["peak_bytes"] * (1 + tolerance) + 256:
+        problems.append(f"peak memory {result['peak_bytes']:,} bytes, baseline {baseline['peak_bytes']:,}")
+    if result["blocks_per_call"] > baseline["blocks_per_call"] + 0.5:
+        problems.append(f"keeps {result['blocks_per_call']:.2f} blocks per call, baseline {baseline['blocks_per_call']:.2f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bue-bench", description="Benchmark the code of .bnode definitions")
+    parser.add_argument("paths", nargs="+", help=".bnode files")
+    parser.add_argument("--baseline", help=f"baseline file (default: {DEFAULT_BASELINE} next to the first .bnode)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before failing (0.15 = 15%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, help="calls per round (default: about 0.2 s worth)")
+    parser.add_argument("--warmup", type=float, default=0.2, help="seconds of calls before timing")
+    parser.add_argument("--size", type=int, default=100, help="items in generated containers")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    baseline_path = args.baseline or os.path.join(os.path.dirname(args.paths[0]), DEFAULT_BASELINE)
+    try:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        baseline = {}
+
+    empty, _ = measure(lambda a, b: None, make_inputs(["int", "int"], args.seed), args.repeat, args.warmup)
+    print(f"empty node: {1 / empty:,.0f} ops/s ({empty * 1e9:.0f} ns/call)")
+
+    status = 0
+    for path in args.paths:
+        key = os.path.basename(path)
+        try:
+            result = bench_node(path, args)
+        except (OSError, bnode.BnodeError, ExecutionError) as error:
+            print(f"{path}: {error}")
+            status = 2
+            continue
+        except Exception as error:
+            print(f"{path}: the code failed with the generated inputs: {type(error).__name__}: {error}")
+            status = 2
+            continue
+        print(f"{path}  {result['name']}")
+        print(f"  {result['ops']:,.0f} ops/s ({result['ns']:.0f} ns/call, best of {args.repeat} x {result['calls']:,} calls)")
+        print(f"  peak {result['peak_bytes']:,} bytes/call, {result['blocks_per_call']:.2f} blocks kept/call")
+        if args.save:
+            baseline[key] = result
+        elif key in baseline:
+            change = result["ops"] / baseline[key]["ops"] - 1
+            problems = compare(result, baseline[key], args.tolerance)
+            print(f"  baseline {baseline[key]['ops']:,.0f} ops/s ({change:+.1%}): {'; '.join(problems) or 'ok'}")
+            if problems:
+                status = max(status, 1)
+        else:
+            print("  no baseline (--save to record one)")
+
+    if args.save:
+        with open(baseline_path, "w") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"baseline saved to {baseline_path}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# Ejecucion de los grafos.
+#
+# The code of a node is the body of a function whose parameters are the node
+# inputs, e.g. "return Input1 + Input2". A node with one output returns its
+# value; with several outputs it returns a tuple/list with one value per output.
+#
+# Values are checked against the declared input types at run time only when the
+# project has connections whose types don't fit (project.type_errors); a graph
+# that validated cleanly skips the checks.
+#
+# Nodes are evaluated in the order the project keeps up to date as wires are
+# added (project.evaluation_order()), so a run doesn't sort the graph. A macro
+# node (anything with an "inner" project, see MacroNode in the IDE) is
+# evaluated as a single unit: its inner graph runs with the macro inputs fed to
+# the boundary ports. When every node inside is pure (node.pure, the "pure"
+# key of a .bnode) the results of its last MACRO_CACHE_SIZE different inputs
+# are kept and reused; a macro with any other node always runs.
+#
+# With a SandboxPool (sandbox.py) the node code runs in worker processes
+# instead of the IDE: nodes whose inputs are ready are handed to the free
+# workers, so independent branches run at the same time, and a slow or
+# crashing node only costs its own result. Macros are still expanded here,
+# once the nodes already sent to the workers have finished. Large values stay
+# in shared memory between the nodes (shared_values.py) and are copied into
+# this process once, when the run ends.
+#
+# executor.listener, when set, is called as listener(event, node, value) while a
+# run goes on: "start" when a node is sent to run, "done" with its outputs and
+# "error" with the message. It may be called from whatever thread runs the
+# graph, so it should only record the event (see RunMonitor in run_monitor.py).
+# executor.tracer, when set, gets every evaluation with its inputs and outputs
+# (TraceWriter in run_trace.py).
+import time
+from port_types import matches_value
+from shared_values import SharedStore
+
+MACRO_CACHE_SIZE = 8  # Input values remembered per macro
+
+
+class ExecutionError(Exception):
+    def __init__(self, node, message):
+        self.node = node
+        self.message = message
+        super().__init__(f"{node.name}: {message}")
+
+
+def _indent(code):
+    return "\n".join("    " + line for line in code.split("\n"))
+
+
+def node_source(node):
+    for name in node.inputs:
+        if not name.isidentifier():
+            raise ExecutionError(node, f"input {name!r} is not a valid name")
+    return f"def __node({', '.join(node.inputs)}):\n{_indent(node.code or 'return None')}\n"
+
+
+def compile_node(node):
+    source = node_source(node)
+    scope = {}
+    try:
+        exec(compile(source, f"<{node.name}>", "exec"), scope)
+    except SyntaxError as error:
+        raise ExecutionError(node, f"syntax error in code: {error.msg} (line {error.lineno - 1})")
+    return scope["__node"]
+
+
+def _pure(project):
+    # Every node (nested macros included) declared to depend only on its inputs
+    return all(_pure(node.inner) if getattr(node, "inner", None) is not None else node.pure for node in project.nodes)
+
+
+def _hashable(values):
+    try:
+        hash(values)
+        return True
+    except TypeError:
+        return False
+
+
+class Executor:
+    def __init__(self, pool=None):
+        self._compiled = {}
+        self.pool = pool
+        self.shared = SharedStore()
+        self.listener = None
+        self.tracer = None
+
+    def _emit(self, event, node, value=None):
+        if self.listener is not None:
+            self.listener(event, node, value)
+
+    def _trace(self, node, start, args, outputs=None, error=None):
+        if self.tracer is not None:
+            self.tracer.record(node, start, time.perf_counter_ns(), args, outputs, error, self.shared.view)
+
+    def _function(self, node):
+        key = (node.code, tuple(node.inputs))
+        function = self._compiled.get(key)
+        if function is None:
+            function = compile_node(node)
+            self._compiled[key] = function
+        return function
+
+    def _outputs(self, node, value):
+        count = len(node.outputs)
+        if count == 1:
+            return [value]
+        if value is None:
+            return [None] * count
+        value = list(value)
+        if len(value) != count:
+            raise ExecutionError(node, f"returned {len(value)} values for {count} outputs")
+        return value
+
+    def run_node(self, node, args):
+        if getattr(node, "inner", None) is not None:
+            return self.run_macro(node, args)
+        try:
+            value = self._function(node)(*args)
+        except ExecutionError:
+            raise
+        except Exception as error:
+            raise ExecutionError(node, f"{type(error).__name__}: {error}")
+        return self._outputs(node, value)
+
+    def run_macro(self, macro, args):
+        key = tuple(args)
+        cache = macro.result_cache  # Least recently used first
+        cacheable = _hashable(key) and _pure(macro.inner)
+        if cacheable and key in cache:
+            cache[key] = cache.pop(key)
+            return cache[key]
+        overrides = {}
+        for (inner_node, port), value in zip(macro.input_map, args):
+            overrides[(inner_node, port)] = value
+        results = self.run(macro.inner, overrides)
+        outputs = [results[inner_node][port] for inner_node, port in macro.output_map]
+        if cacheable:
+            cache[key] = outputs
+            if len(cache) > MACRO_CACHE_SIZE:
+                del cache[next(iter(cache))]
+        return outputs
+
+    def _arguments(self, project, node, results, overrides, check_types):
+        args = []
+        for port in range(len(node.inputs)):
+            connections = project.incoming(node, port)
+            if (node, port) in overrides:
+                args.append(overrides[(node, port)])
+            elif connections:
+                args.append(results[connections[0].start_node][connections[0].start_port])
+            else:
+                args.append(None)
+        if check_types:
+            for port, value in enumerate(args):
+                if not matches_value(node.input_types[port], value):
+                    raise ExecutionError(node, f"input {node.inputs[port]} expects {node.input_types[port]}, got {type(value).__name__}")
+        return args
+
+    def run(self, project, overrides=None, order=None):
+        # Returns {node: [value per output]}. overrides maps (node, input port)
+        # to a value that replaces whatever is (or isn't) connected there.
+        overrides = overrides or {}
+        check_types = bool(project.type_errors)
+        order = order if order is not None else project.evaluation_order()
+        if self.pool is not None:
+            return self._run_in_pool(project, overrides, order, check_types)
+        results = {}
+        for node in order:
+            args = self._arguments(project, node, results, overrides, check_types)
+            self._emit("start", node)
+            start = time.perf_counter_ns()
+            try:
+                results[node] = self.run_node(node, args)
+            except ExecutionError as error:
+                self._trace(node, start, args, error=error.message)
+                self._emit("error", node, error.message)
+                raise
+            self._trace(node, start, args, results[node])
+            self._emit("done", node, results[node])
+        return results
+
+    def _run_in_pool(self, project, overrides, order, check_types):
+        results = {}
+        position = {node: i for i, node in enumerate(order)}
+        # Inputs still to be computed, per node (only wires inside this run)
+        waiting = {}
+        for node in order:
+            waiting[node] = len(set(c.start_node for c in project.incoming(node) if c.start_node in position
+                                    and (node, c.end_port) not in overrides))
+        ready = [node for node in order if waiting[node] == 0]
+        running = {}  # {task id: (node, args, start time)}
+        try:
+            while ready or running:
+                ready.sort(key=position.get)
+                # Plain nodes go to the free workers; a macro waits until the
+                # workers are done and then runs here
+                for node in [node for node in ready if getattr(node, "inner", None) is None]:
+                    args = self._arguments(project, node, results, overrides, check_types)
+                    self._function(node)  # Syntax errors are reported before sending
+                    if not self.pool.submit(id(node), (node.code, tuple(node.inputs)), node_source(node), node.name, args):
+                        break
+                    for arg in args:
+                        self.shared.acquire(arg)
+                    ready.remove(node)
+                    running[id(node)] = (node, args, time.perf_counter_ns())
+                    self._emit("start", node)
+                finished = []
+                failed = None
+                if running:
+                    # Every reply of the batch is adopted (its blocks are ours
+                    # from here on) before the first error is raised
+                    for task_id, ok, value in self.pool.wait():
+                        node, args, start = running.pop(task_id)
+                        try:
+                            if not ok:
+                                self._trace(node, start, args, error=value)
+                                self._emit("error", node, value)
+                                failed = failed or ExecutionError(node, value)
+                                continue
+                            self.shared.adopt(value)
+                            try:
+                                outputs = self._outputs(node, value)
+                            except ExecutionError as error:
+                                self.shared.release(value)
+                                failed = failed or error
+                                continue
+                            self._trace(node, start, args, outputs)
+                        finally:
+                            for arg in args:
+                                self.shared.release(arg)
+                        finished.append((node, outputs))
+                elif ready:
+                    node = ready.pop(0)
+                    args = self.shared.materialize(self._arguments(project, node, results, overrides, check_types))
+                    self._emit("start", node)
+                    start = time.perf_counter_ns()
+                    try:
+                        finished.append((node, self.run_macro(node, args)))
+                    except ExecutionError as error:
+                        self._trace(node, start, args, error=error.message)
+                        self._emit("error", node, error.message)
+                        raise
+                    self._trace(node, start, args, finished[-1][1])
+                # All of the batch goes into results (and so is freed by the
+                # finally block) before a listener can stop the run
+                for node, outputs in finished:
+                    results[node] = outputs
+                for node, outputs in finished:
+                    self._emit("done", node, outputs)
+                    for successor in set(c.end_node for c in project.outgoing(node) if c.end_node in position
+                                         and (c.end_node, c.end_port) not in overrides):
+                        waiting[successor] -= 1
+                        if waiting[successor] == 0:
+                            ready.append(successor)
+                if failed is not None:
+                    raise failed
+        finally:
+            if running:
+                self.pool.abort()
+                for node, args, start in running.values():
+                    for arg in args:
+                        self.shared.release(arg)
+            # Values still in shared memory are copied here and their blocks freed
+            for node, outputs in results.items():
+                copies = self.shared.materialize(outputs)
+                for value in outputs:
+                    self.shared.release(value)
+                results[node] = copies
+        return results
@@ -0,0 +1,162 @@
+# Trabajos en segundo plano (layout, rutas de cables...).
+#
+# Heavy work runs in a worker process (or a thread for work that waits on
+# files) so the main loop keeps drawing. The main loop calls poll() once per
+# frame and gets the jobs that finished; nothing it owns is touched by a worker.
+#
+# A job function takes plain data and a "progress" keyword: calling
+# progress(fraction) reports how far it got, and raises JobCancelled once the
+# job has been cancelled, so long loops stop early. Starting a job of a kind
+# that is already running cancels the old one (a new layout replaces the
+# previous request).
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+CANCEL_SLOTS = 64  # Job id % CANCEL_SLOTS -> id of the last job cancelled there
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# State of the worker processes, set by _start_worker
+_progress_queue = None
+_cancelled = None
+
+
+def _start_worker(progress_queue, cancelled):
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+
+class _Progress:
+    def __init__(self, job_id, cancelled, send):
+        self.job_id = job_id
+        self.cancelled = cancelled
+        self.send = send
+        self.last = -1.0
+
+    def __call__(self, fraction):
+        if self.cancelled[self.job_id % CANCEL_SLOTS] == self.job_id:
+            raise JobCancelled()
+        # Only send changes of 1% or more, the main loop doesn't need more
+        if fraction - self.last >= 0.01 or fraction >= 1:
+            self.last = fraction
+            self.send(self.job_id, fraction)
+
+
+def _send_from_process(job_id, fraction):
+    _progress_queue.put((job_id, fraction))
+
+
+def _run_in_process(job_id, function, args):
+    return function(*args, progress=_Progress(job_id, _cancelled, _send_from_process))
+
+
+class Job:
+    def __init__(self, job_id, kind, data):
+        self.id = job_id
+        self.kind = kind
+        self.data = data  # Whatever the main loop needs to use the result
+        self.progress = 0.0
+        self.cancelled = False
+        self.future = None
+        self.result = None
+        self.error = None
+
+
+class JobRunner:
+    def __init__(self, processes=1, threads=2):
+        self.processes = processes
+        self.threads = threads
+        self._process_pool = None  # Started on first use
+        self._thread_pool = None
+        self._progress_queue = None
+        self._cancelled = multiprocessing.RawArray("q", CANCEL_SLOTS)
+        self._finished = queue.Queue()
+        self._next_id = 1
+        self.running = {}  # {job id: job}
+
+    def _pool(self, process):
+        if not process:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.threads)
+            return self._thread_pool
+        if self._process_pool is None:
+            self._progress_queue = multiprocessing.Queue()
+            self._process_pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_start_worker,
+                                                     initargs=(self._progress_queue, self._cancelled))
+        return self._process_pool
+
+    def submit(self, kind, function, *args, data=None, process=True):
+        for job in list(self.running.values()):
+            if job.kind == kind:
+                self.cancel(job)
+        job = Job(self._next_id, kind, data)
+        self._next_id += 1
+        if process:
+            job.future = self._pool(True).submit(_run_in_process, job.id, function, args)
+        else:
+            progress = _Progress(job.id, self._cancelled, self._set_progress)
+            job.future = self._pool(False).submit(function, *args, progress=progress)
+        self.running[job.id] = job
+        job.future.add_done_callback(lambda future: self._finished.put(job))
+        return job
+
+    def _set_progress(self, job_id, fraction):
+        # From a worker thread; a float assignment is safe without a lock
+        job = self.running.get(job_id)
+        if job is not None:
+            job.progress = fraction
+
+    def cancel(self, job):
+        job.cancelled = True
+        self._cancelled[job.id % CANCEL_SLOTS] = job.id
+        job.future.cancel()
+        self.running.pop(job.id, None)
+
+    def cancel_all(self):
+        for job in list(self.running.values()):
+            self.cancel(job)
+
+    def poll(self):
+        # Finished jobs since the last call (cancelled ones are dropped), with
+        # job.result or job.error set
+        if self._progress_queue is not None:
+            while True:
+                try:
+                    job_id, fraction = self._progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._set_progress(job_id, fraction)
+        done = []
+        while True:
+            try:
+                job = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled:
+                continue
+            self.running.pop(job.id, None)
+            try:
+                job.result = job.future.result()
+            except JobCancelled:
+                continue
+            except Exception as error:
+                job.error = error
+            job.progress = 1.0
+            done.append(job)
+        return done
+
+    def shutdown(self):
+        # Worker processes are left to end on their own; the threads are
+        # waited for, since their jobs may use things the caller frees next
+        # (a run goes through the sandbox pool). Cancelled, they stop at their
+        # next progress() call.
+        self.cancel_all()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,174 @@
+# Auto-layout por capas (estilo Sugiyama), de izquierda a derecha.
+#
+# Works on plain data so it can run in a worker process:
+#   sizes  [(width, height)] per node
+#   edges  [(from index, to index)]
+#   order  node indices in topological order (Project.evaluation_order())
+# and returns the top-left (x, y) of every node.
+#
+# Steps: longest-path layering, dummy nodes on wires that skip layers,
+# barycenter sweeps to reduce crossings (keeping the best ordering found), then
+# y coordinates pulled towards the connected nodes without overlapping.
+#
+# progress(fraction), if given, is called between the steps (see jobs.py).
+LAYER_GAP = 100
+NODE_GAP = 40
+DUMMY_HEIGHT = 20
+SWEEPS = 8
+
+
+def _layers(count, edges, order):
+    predecessors = [[] for _ in range(count)]
+    for start, end in edges:
+        predecessors[end].append(start)
+    layer = [0] * count
+    for node in order:
+        for previous in predecessors[node]:
+            if layer[previous] + 1 > layer[node]:
+                layer[node] = layer[previous] + 1
+    return layer
+
+
+def _split_long_edges(count, edges, layer):
+    # Returns (layer of every node incl. dummies, edges between adjacent layers)
+    layer = list(layer)
+    short_edges = []
+    for start, end in edges:
+        previous = start
+        for step in range(layer[start] + 1, layer[end]):
+            dummy = len(layer)
+            layer.append(step)
+            short_edges.append((previous, dummy))
+            previous = dummy
+        short_edges.append((previous, end))
+    return layer, short_edges
+
+
+def _crossings(upper, lower, down_neighbours):
+    # Crossings between two adjacent layers: inversions of the lower positions
+    # when the edges are sorted by upper position (counted with a Fenwick tree)
+    position = {node: i for i, node in enumerate(lower)}
+    tree = [0] * (len(lower) + 1)
+    seen = 0
+    crossings = 0
+    for node in upper:
+        targets = sorted(position[n] for n in down_neighbours[node])
+        for target in targets:
+            # Edges already seen that end after target
+            i = target + 1
+            not_after = 0
+            while i > 0:
+                not_after += tree[i]
+                i -= i & -i
+            crossings += seen - not_after
+        for target in targets:
+            i = target + 1
+            while i < len(tree):
+                tree[i] += 1
+                i += i & -i
+            seen += 1
+    return crossings
+
+
+def _total_crossings(rows, successors):
+    return sum(_crossings(rows[i], rows[i + 1], successors) for i in range(len(rows) - 1))
+
+
+def _sweep(rows, neighbours, downward):
+    indices = range(1, len(rows)) if downward else range(len(rows) - 2, -1, -1)
+    for i in indices:
+        fixed = rows[i - 1] if downward else rows[i + 1]
+        position = {node: p for p, node in enumerate(fixed)}
+        keyed = []
+        for current, node in enumerate(rows[i]):
+            linked = [position[n] for n in neighbours[node] if n in position]
+            keyed.append((sum(linked) / len(linked) if linked else current, current, node))
+        keyed.sort()
+        rows[i] = [node for _, _, node in keyed]
+
+
+def _order_layers(rows, successors, predecessors, progress):
+    best = [list(row) for row in rows]
+    best_crossings = _total_crossings(rows, successors)
+    for sweep in range(SWEEPS):
+        if best_crossings == 0:
+            break
+        _sweep(rows, predecessors if sweep % 2 == 0 else successors, sweep % 2 == 0)
+        crossings = _total_crossings(rows, successors)
+        if crossings < best_crossings:
+            best = [list(row) for row in rows]
+            best_crossings = crossings
+        progress(0.1 + 0.6 * (sweep + 1) / SWEEPS)
+    return best
+
+
+def _place_row(row, heights, desired):
+    # Centers as close as possible to desired, in order, without overlaps
+    centers = []
+    for node in row:
+        center = desired[node]
+        if centers:
+            previous = row[len(centers) - 1]
+            lowest = centers[-1] + (heights[previous] + heights[node]) / 2 + NODE_GAP
+            center = max(center, lowest)
+        centers.append(center)
+    # Spread the push-down evenly so the row stays centered on its targets
+    shift = sum(desired[node] - center for node, center in zip(row, centers)) / max(len(row), 1)
+    return [center + shift for center in centers]
+
+
+def _no_progress(fraction):
+    pass
+
+
+def layout_graph(sizes, edges, order, progress=None):
+    progress = progress or _no_progress
+    count = len(sizes)
+    if count == 0:
+        return []
+    layer, short_edges = _split_long_edges(count, edges, _layers(count, edges, order))
+    total = len(layer)
+    successors = [[] for _ in range(total)]
+    predecessors = [[] for _ in range(total)]
+    for start, end in short_edges:
+        successors[start].append(end)
+        predecessors[end].append(start)
+
+    rows = [[] for _ in range(max(layer) + 1)]
+    for node in order:
+        rows[layer[node]].append(node)
+    for node in range(count, total):
+        rows[layer[node]].append(node)
+    progress(0.1)
+    rows = _order_layers(rows, successors, predecessors, progress)
+
+    widths = [size[0] for size in sizes] + [0] * (total - count)
+    heights = [size[1] for size in sizes] + [DUMMY_HEIGHT] * (total - count)
+
+    # Start stacked, then pull every row towards its neighbours, both ways
+    center = {}
+    for row in rows:
+        y = 0
+        for node in row:
+            center[node] = y + heights[node] / 2
+            y += heights[node] + NODE_GAP
+    passes = ((predecessors, rows[1:]), (successors, rows[-2::-1]), (predecessors, rows[1:]))
+    for done, (neighbours, row_order) in enumerate(passes):
+        for row in row_order:
+            desired = {}
+            for node in row:
+                linked = [center[n] for n in neighbours[node]]
+                desired[node] = sum(linked) / len(linked) if linked else center[node]
+            for node, y in zip(row, _place_row(row, heights, desired)):
+                center[node] = y
+        progress(0.7 + 0.1 * (done + 1))
+
+    positions = [None] * count
+    x = 0
+    for row in rows:
+        for node in row:
+            if node < count:
+                positions[node] = (x, center[node] - heights[node] / 2)
+        x += max(widths[node] for node in row) + LAYER_GAP
+    top = min(y for _, y in positions)
+    return [(round(px), round(py - top)) for px, py in positions]
@@ -0,0 +1,157 @@
+# Search index for the predefined nodes panel.
+# Everything is precomputed when the index is built so that filtering while
+# typing only does string lookups, even with thousands of .bnode entries.
+# With that many entries a search still takes tens of ms, so steps() does it
+# SEARCH_STEP entries at a time and the panel spreads it over a few frames.
+import re
+
+NAME_WEIGHT = 3
+TYPES_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+SEARCH_STEP = 250
+
+
+def _char_mask(text):
+    # Bit set of the characters in text, used to reject entries before doing
+    # the (slower) in-order match
+    mask = 0
+    for c in set(text):
+        mask |= 1 << (ord(c) & 63)
+    return mask
+
+
+def _in_order(query):
+    # Finds the characters of query in order, each at the first place it can
+    # be: the gaps between them (counted from the start) are end() - len(query)
+    return re.compile(".*?".join(re.escape(c) for c in query), re.DOTALL).search
+
+
+def _fuzzy_score(query, haystack, in_order):
+    # Returns None if the characters of query don't appear in order in haystack
+    start = haystack.find(query)
+    if start != -1:
+        # Whole substring: best case, earlier is better
+        return 1000 - start
+    match = in_order(haystack)
+    if match is None:
+        return None
+    return 500 - (match.end() - len(query))
+
+
+class PaletteEntry:
+    def __init__(self, name, description="", input_types=(), output_types=(), path=None, offset=0, length=None):
+        self.name = name
+        self.description = description
+        self.input_types = list(input_types)
+        self.output_types = list(output_types)
+        # Where the full definition is: a .bnode file or a slice of a .bpack
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+
+class PaletteIndex:
+    def __init__(self, entries=()):
+        self.entries = []
+        self._fields = []
+        self._masks = []
+        self._cache = {}
+        self._ranks = None  # Position of every entry sorted by name (ties in the results)
+        self._by_rank = None  # Entry at every position
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        name = entry.name.lower()
+        types = " ".join(entry.input_types + entry.output_types).lower()
+        description = entry.description.lower()
+        self.entries.append(entry)
+        self._fields.append(((name, NAME_WEIGHT), (types, TYPES_WEIGHT), (description, DESCRIPTION_WEIGHT)))
+        self._masks.append(_char_mask(name + types + description))
+        self._cache.clear()
+        self._ranks = None
+        self._by_rank = None
+
+    def state(self):
+        # Plain data with the precomputed fields (from_state skips computing them)
+        entries = [(e.name, e.description, e.input_types, e.output_types, e.path, e.offset, e.length) for e in self.entries]
+        return entries, self._fields, self._masks
+
+    @classmethod
+    def from_state(cls, state):
+        entries, fields, masks = state
+        index = cls()
+        index.entries = [PaletteEntry(*entry) for entry in entries]
+        index._fields = fields
+        index._masks = masks
+        return index
+
+    def _score(self, i, query, mask, in_order):
+        if mask & ~self._masks[i]:
+            return None
+        best = None
+        for text, weight in self._fields[i]:
+            if best is not None and best >= weight * 1000:
+                # Fields are ordered by weight, nothing below can beat this
+                break
+            score = _fuzzy_score(query, text, in_order)
+            if score is not None:
+                score *= weight
+                if best is None or score > best:
+                    best = score
+        return best
+
+    def _name_ranks(self):
+        if self._ranks is None:
+            self._by_rank = sorted(range(len(self.entries)), key=lambda i: self._fields[i][0][0])
+            self._ranks = [0] * len(self.entries)
+            for rank, i in enumerate(self._by_rank):
+                self._ranks[i] = rank
+        return self._ranks
+
+    def steps(self, query):
+        # search() in steps: yields None after every SEARCH_STEP entries and
+        # the result at the end. Results are cached per query; when the query
+        # grows only the entries that matched the shorter query are scored.
+        query = query.strip().lower()
+        if not query:
+            yield list(range(len(self.entries)))
+            return
+        if query in self._cache:
+            yield self._cache[query]
+            return
+
+        candidates = range(len(self.entries))
+        for end in range(len(query) - 1, 0, -1):
+            if query[:end] in self._cache:
+                candidates = self._cache[query[:end]]
+                break
+
+        mask = _char_mask(query)
+        in_order = _in_order(query)
+        ranks = self._name_ranks()
+        count = len(self.entries)
+        # One int per match: sorting them puts the best score first and
+        # equal scores by name (rank), and key % count gives the rank back
+        keys = []
+        for begin in range(0, len(candidates), SEARCH_STEP):
+            for i in candidates[begin:begin + SEARCH_STEP]:
+                score = self._score(i, query, mask, in_order)
+                if score is not None:
+                    keys.append(ranks[i] - score * count)
+            if begin + SEARCH_STEP < len(candidates):
+                yield None
+        keys.sort()
+        by_rank = self._by_rank
+        result = [by_rank[key % count] for key in keys]
+        self._cache[query] = result
+        yield result
+
+    def search(self, query):
+        # Returns the indices of the matching entries, best match first
+        for result in self.steps(query):
+            pass
+        return result
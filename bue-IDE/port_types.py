@@ -0,0 +1,99 @@
+# Tipos de los puertos (input_types / output_types de los .bnode).
+#
+# Compatibility of an output type (source) with an input type (target):
+#   - "Any" on either side is compatible with everything
+#   - the same type is compatible (names are not case sensitive)
+#   - widening: bool -> int -> float, and bool/int/float -> number
+#   - containers: "list[int]" -> "list" and "list[int]" -> "list[float]";
+#     a bare "list" -> "list[int]" is allowed (element type unknown)
+#   - unions "int|str": every option of the source must fit some option of
+#     the target
+# Type names that are not known here (user types) only match themselves or Any.
+from functools import lru_cache
+
+from shared_values import SharedValue
+
+WIDENING = {
+    "bool": {"int", "float", "number"},
+    "int": {"float", "number"},
+    "float": {"number"},
+}
+
+CONTAINERS = {"list", "dict", "set", "tuple"}
+
+
+def _split_union(name):
+    parts = []
+    depth = 0
+    current = ""
+    for c in name:
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        if c == "|" and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += c
+    parts.append(current.strip())
+    return parts
+
+
+def _parse(name):
+    # "list[int]" -> ("list", "int"); "int" -> ("int", None)
+    name = name.strip().lower()
+    if name.endswith("]") and "[" in name:
+        base, argument = name[:-1].split("[", 1)
+        return base.strip(), argument.strip()
+    return name, None
+
+
+def _single_compatible(source, target):
+    source_base, source_argument = _parse(source)
+    target_base, target_argument = _parse(target)
+    if source_base == "any" or target_base == "any":
+        return True
+    if source_base != target_base:
+        return target_base in WIDENING.get(source_base, ())
+    if source_argument is None or target_argument is None:
+        return True
+    return is_compatible(source_argument, target_argument)
+
+
+@lru_cache(maxsize=None)
+def is_compatible(source, target):
+    targets = _split_union(target)
+    return all(any(_single_compatible(s, t) for t in targets) for s in _split_union(source))
+
+
+PYTHON_TYPES = {
+    "bool": (bool,),
+    "int": (int,),
+    "float": (int, float),
+    "number": (int, float),
+    "str": (str,),
+    "list": (list, tuple),
+    "tuple": (tuple,),
+    "dict": (dict,),
+    "set": (set, frozenset),
+}
+
+
+# What a SharedValue holds (shared_values); arrays are none of PYTHON_TYPES
+SHARED_TYPES = {"bytes": bytes, "table": dict, "array": object}
+
+
+def matches_value(type_name, value):
+    # Runtime check used when a graph has not validated cleanly.
+    # None (nothing connected) is always accepted.
+    if value is None:
+        return True
+    value_type = SHARED_TYPES[value.kind] if isinstance(value, SharedValue) else type(value)
+    for option in _split_union(type_name):
+        base, argument = _parse(option)
+        if base == "any" or base not in PYTHON_TYPES:
+            return True
+        if issubclass(value_type, PYTHON_TYPES[base]):
+            return True
+    return False
@@ -0,0 +1,147 @@
+# Dibujo por lotes de cables y puertos.
+#
+# Instead of one pygame.draw call per port circle and a Python loop per wire,
+# the frame collects its primitives here and flush() draws them at once:
+#   - circles and rings are stamped from cached colorkey sprites with a
+#     single surface.blits() call
+#   - wire curves are evaluated together (with NumPy when it is installed,
+#     imported by the first batch big enough to use it) from precomputed Bezier
+#     coefficients, then drawn with one pygame.draw.lines call per wire
+#   - polylines (routed wires) are drawn as they are
+# Everything is drawn in flush(): wires first, then the circles on top. The
+# garbage collector is paused meanwhile: the point lists of a big graph are
+# millions of short-lived objects and the collections took most of the time.
+import gc
+import pygame
+
+numpy = False  # Not imported yet (None: not installed)
+
+# Segments per curve, picked by its length on screen
+SEGMENT_STEPS = (8, 16, 32, 64)
+PIXELS_PER_SEGMENT = 16
+
+_coefficients = {}
+_sprites = {}
+
+
+def _weights(t):
+    # Weights of start, end and bend for the point at t of a cubic Bezier whose
+    # control points are start + (bend, 0) and end - (bend, 0)
+    u = 1 - t
+    return (u ** 3 + 3 * u * u * t, 3 * u * t * t + t ** 3, 3 * u * u * t - 3 * u * t * t)
+
+
+def numpy_module():
+    # NumPy takes longer to import than the IDE takes to start, so it is only
+    # imported when a frame first needs it
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+def _curve_coefficients(segments):
+    table = _coefficients.get(segments)
+    if table is None:
+        table = [_weights(i / segments) for i in range(segments + 1)]
+        _coefficients[segments] = table
+    return table
+
+
+def _segments(start, end):
+    length = abs(end[0] - start[0]) + abs(end[1] - start[1])
+    for steps in SEGMENT_STEPS:
+        if length <= steps * PIXELS_PER_SEGMENT:
+            return steps
+    return SEGMENT_STEPS[-1]
+
+
+def circle_sprite(color, radius, width=0):
+    key = (tuple(color), radius, width)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        if len(_sprites) > 1024:
+            _sprites.clear()
+        key_color = (255, 0, 255) if tuple(color[:3]) != (255, 0, 255) else (0, 255, 0)
+        sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+        sprite.fill(key_color)
+        pygame.draw.circle(sprite, color, (radius, radius), radius, width)
+        sprite.set_colorkey(key_color, pygame.RLEACCEL)
+        _sprites[key] = sprite
+    return sprite
+
+
+def curve_points(curves, segments):
+    # curves: [(start, end, bend)], all with the same number of segments.
+    # Returns a list of point lists.
+    table = _curve_coefficients(segments)
+    if len(curves) > 8 and numpy_module() is not None:
+        weights = numpy.array(table)  # (points, 3)
+        data = numpy.array([(s[0], s[1], e[0], e[1], b) for s, e, b in curves], dtype=float)
+        xs = numpy.outer(data[:, 0], weights[:, 0]) + numpy.outer(data[:, 2], weights[:, 1]) + numpy.outer(data[:, 4], weights[:, 2])
+        ys = numpy.outer(data[:, 1], weights[:, 0]) + numpy.outer(data[:, 3], weights[:, 1])
+        return numpy.stack((xs, ys), axis=2).astype(int).tolist()
+    result = []
+    for (sx, sy), (ex, ey), bend in curves:
+        result.append([(int(sx * a + ex * b + bend * c), int(sy * a + ey * b)) for a, b, c in table])
+    return result
+
+
+def curve_point(start, end, bend, t):
+    a, b, c = _weights(t)
+    return (start[0] * a + end[0] * b + bend * c, start[1] * a + end[1] * b)
+
+
+def polyline_point(points, t):
+    # The point at fraction t of the length of a polyline
+    lengths = [abs(b[0] - a[0]) + abs(b[1] - a[1]) for a, b in zip(points, points[1:])]
+    left = t * sum(lengths)
+    for (a, b), length in zip(zip(points, points[1:]), lengths):
+        if left <= length and length:
+            f = left / length
+            return (a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f)
+        left -= length
+    return points[-1]
+
+
+class PrimitiveBatch:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._stamps = []
+        self._curves = {}  # {(color, width, segments): [(start, end, bend)]}
+        self._lines = []  # (color, points, width)
+
+    def circle(self, color, center, radius, width=0):
+        if radius < 1:
+            return
+        self._stamps.append((circle_sprite(color, radius, width), (int(center[0]) - radius, int(center[1]) - radius)))
+
+    def curve(self, color, start, end, bend, width):
+        # Wire from start to end leaving and entering horizontally
+        key = (tuple(color), max(1, width), _segments(start, end))
+        self._curves.setdefault(key, []).append((start, end, bend))
+
+    def lines(self, color, points, width):
+        self._lines.append((color, points, max(1, width)))
+
+    def flush(self, surface):
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for (color, width, segments), curves in self._curves.items():
+                for points in curve_points(curves, segments):
+                    pygame.draw.lines(surface, color, False, points, width)
+            for color, points, width in self._lines:
+                pygame.draw.lines(surface, color, False, points, width)
+            if self._stamps:
+                surface.blits(self._stamps, doreturn=False)
+        finally:
+            if collecting:
+                gc.enable()
+        self.clear()
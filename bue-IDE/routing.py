@@ -0,0 +1,164 @@
+# Cables ortogonales que esquivan los nodos.
+#
+# A wire leaves its output port to the right, enters the input port from the
+# left, and in between follows a path of horizontal and vertical segments found
+# with A* on a grid (GRID pixels) around the two ports. Node rects, grown by
+# CLEARANCE, block the grid; turns cost extra so routes have few bends. A
+# search gives up after MAX_EXPANSIONS cells (long or blocked wires could take
+# hundreds of ms on the main thread) and the wire gets the elbow fallback.
+#
+# Rects are plain (x, y, width, height) tuples and points are world coordinates,
+# so nothing here depends on pygame.
+import heapq
+
+GRID = 20
+CLEARANCE = 10
+STUB = 20  # Straight piece out of / into the ports
+MARGIN = 200  # Search area around the two ports
+BEND_COST = 3
+MAX_EXPANSIONS = 5000
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+def route_box(start, end, margin=MARGIN):
+    left = min(start[0], end[0]) - margin
+    top = min(start[1], end[1]) - margin
+    return (left, top, max(start[0], end[0]) + margin - left, max(start[1], end[1]) + margin - top)
+
+
+def _blocked_cells(origin, size, obstacles):
+    blocked = set()
+    for x, y, width, height in obstacles:
+        x -= CLEARANCE
+        y -= CLEARANCE
+        right = x + width + 2 * CLEARANCE
+        bottom = y + height + 2 * CLEARANCE
+        # Grid points strictly inside the grown rect
+        i0 = max(0, int((x - origin[0]) // GRID) + 1)
+        j0 = max(0, int((y - origin[1]) // GRID) + 1)
+        i1 = min(size[0] - 1, int(-(-(right - origin[0]) // GRID)) - 1)
+        j1 = min(size[1] - 1, int(-(-(bottom - origin[1]) // GRID)) - 1)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                blocked.add((i, j))
+    return blocked
+
+
+def _search(first, goal, size, blocked):
+    # A* over (cell, direction); returns the cells of the path, or None if
+    # there is none or it wasn't found in MAX_EXPANSIONS steps
+    def estimate(cell):
+        return abs(cell[0] - goal[0]) + abs(cell[1] - goal[1])
+
+    # Ties go to the deepest state, so open space is crossed without
+    # spreading over every equally good cell
+    queue = [(estimate(first), 0, 0, first, 0)]
+    cost = {(first, 0): 0}
+    previous = {}
+    expansions = 0
+    while queue:
+        expansions += 1
+        if expansions > MAX_EXPANSIONS:
+            return None
+        _, _, spent, cell, direction = heapq.heappop(queue)
+        if cell == goal:
+            path = [cell]
+            state = (cell, direction)
+            while state in previous:
+                state = previous[state]
+                path.append(state[0])
+            path.reverse()
+            return path
+        if spent > cost[(cell, direction)]:
+            continue
+        for new_direction, (di, dj) in enumerate(DIRECTIONS):
+            if new_direction == (direction + 2) % 4:
+                continue
+            neighbour = (cell[0] + di, cell[1] + dj)
+            if not (0 <= neighbour[0] < size[0] and 0 <= neighbour[1] < size[1]) or neighbour in blocked:
+                continue
+            new_cost = spent + 1 + (BEND_COST if new_direction != direction else 0)
+            state = (neighbour, new_direction)
+            if new_cost < cost.get(state, new_cost + 1):
+                cost[state] = new_cost
+                previous[state] = (cell, direction)
+                heapq.heappush(queue, (new_cost + estimate(neighbour), -new_cost, new_cost, neighbour, new_direction))
+    return None
+
+
+def _simplify(points):
+    # Drops the points in the middle of straight runs
+    result = [points[0]]
+    for i in range(1, len(points) - 1):
+        before, point, after = result[-1], points[i], points[i + 1]
+        if (before[0] == point[0] == after[0]) or (before[1] == point[1] == after[1]):
+            continue
+        if point != before:
+            result.append(point)
+    if points[-1] != result[-1]:
+        result.append(points[-1])
+    return result
+
+
+def _elbow(start, end):
+    # Fallback when no free path was found: three segments through the middle
+    middle = (start[0] + end[0]) / 2
+    return [start, (middle, start[1]), (middle, end[1]), end]
+
+
+def route_wire(start, end, obstacles, box=None):
+    # start: output port, end: input port; obstacles: rects of the nodes
+    # around (the two connected nodes included). Returns the corner points.
+    first = (start[0] + STUB, start[1])
+    last = (end[0] - STUB, end[1])
+    box = box or route_box(start, end)
+    origin = (first[0] - ((first[0] - box[0]) // GRID) * GRID, first[1] - ((first[1] - box[1]) // GRID) * GRID)
+    size = (int((box[0] + box[2] - origin[0]) // GRID) + 1, int((box[1] + box[3] - origin[1]) // GRID) + 1)
+    first_cell = (int(round((first[0] - origin[0]) / GRID)), int(round((first[1] - origin[1]) / GRID)))
+    goal = (int(round((last[0] - origin[0]) / GRID)), int(round((last[1] - origin[1]) / GRID)))
+    blocked = _blocked_cells(origin, size, obstacles)
+    blocked.discard(first_cell)
+    blocked.discard(goal)
+    cells = _search(first_cell, goal, size, blocked)
+    if cells is None:
+        return _simplify(_elbow(start, end))
+    points = [start, first] + [(origin[0] + i * GRID, origin[1] + j * GRID) for i, j in cells]
+    # The goal cell can be off the port row by less than a cell
+    points += [(points[-1][0], last[1]), last, end]
+    return _simplify(points)
+
+
+def _intersects(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class RouteCache:
+    # {connection: (start, end, box, points)}. A route is reused while its
+    # ports stay put and nothing moves inside its search box.
+    def __init__(self):
+        self._routes = {}
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, connection, start, end):
+        route = self._routes.get(connection)
+        if route is not None and route[0] == start and route[1] == end:
+            return route[3]
+        return None
+
+    def compute(self, connection, start, end, obstacles_in):
+        # obstacles_in(box) gives the rects inside a box (the spatial index)
+        box = route_box(start, end)
+        points = route_wire(start, end, obstacles_in(box), box)
+        self._routes[connection] = (start, end, box, points)
+        return points
+
+    def invalidate(self, rect):
+        # Something appeared, moved or went away inside rect
+        stale = [connection for connection, route in self._routes.items() if _intersects(route[2], rect)]
+        for connection in stale:
+            del self._routes[connection]
+
+    def discard(self, connection):
+        self._routes.pop(connection, None)
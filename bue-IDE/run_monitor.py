@@ -0,0 +1,106 @@
+# Estado en vivo de una ejecucion, para dibujarlo.
+#
+# The executor reports every node it starts and finishes (executor.listener)
+# from the thread that runs the graph, possibly many thousands of times per
+# second. The monitor only writes the newest event of each node into a pending
+# dict; the main loop calls update() once per frame and applies what piled up,
+# so a node that started and finished between two frames costs one update and
+# the drawing never sees half an event.
+#
+# Times are seconds from whatever clock the caller uses (the main loop passes
+# its own), so nothing here depends on pygame.
+import threading
+
+FLOW_SECONDS = 0.5  # How long a pulse takes along a wire
+
+
+class RunMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # {node: (event, value)} since the last update
+        self.running = False  # A run is going on (set by whoever starts it)
+        self.refused = None  # Time an edit was refused because of the run (see graph_locked in the IDE)
+        self.version = 0  # Goes up whenever something shown changes
+        self.reset()
+
+    def reset(self):
+        # Before a run: forget the states of the previous one
+        with self._lock:
+            self._pending = {}
+        self.states = {}  # {node: "running", "done" or "error"}
+        self.outputs = {}  # {node: last outputs}
+        self.errors = {}  # {node: message}
+        self.samples = {}  # {node: (inputs repr, outputs repr)} from a replayed trace
+        self.fired = {}  # {node: time its outputs arrived}
+        self.changed = {}  # {node: version when it last changed}
+        self.version += 1
+
+    def __call__(self, event, node, value=None):
+        # executor.listener; called from the thread running the graph, which
+        # also sends ("stop", None) when the run is over
+        with self._lock:
+            self._pending[node] = (event, value)
+
+    def update(self, now):
+        # Applies the events since the last call; True if something changed
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return False
+        self.version += 1
+        for node, (event, value) in pending.items():
+            if event == "stop":
+                # The run is over: nodes it left running were aborted
+                for aborted in [n for n, state in self.states.items() if state == "running"]:
+                    del self.states[aborted]
+                    self.changed[aborted] = self.version
+                continue
+            if event == "start":
+                self.states[node] = "running"
+            elif event == "done":
+                self.states[node] = "done"
+                self.outputs[node] = value
+                self.fired[node] = now
+            else:
+                self.states[node] = "error"
+                self.errors[node] = value
+            self.changed[node] = self.version
+        return True
+
+    def finish(self, results, now):
+        # The run ended: its final results replace what the events carried
+        # (values in shared memory are only copied out at the end)
+        self.update(now)
+        self.version += 1
+        for node, outputs in results.items():
+            self.outputs[node] = outputs
+            self.changed[node] = self.version
+
+    def fail(self, node, message, now):
+        self.update(now)
+        self.version += 1
+        self.states[node] = "error"
+        self.errors[node] = message
+        self.changed[node] = self.version
+
+    def show(self, states, errors, samples):
+        # Replay of a trace (run_trace.Replay) at the scrubbed time: replaces
+        # the states instead of adding events
+        self.version += 1
+        for node in set(self.states) | set(states):
+            if self.states.get(node) != states.get(node) or self.samples.get(node) != samples.get(node):
+                self.changed[node] = self.version
+        self.states = states
+        self.errors = errors
+        self.samples = samples
+
+    def flow(self, connection, now):
+        # Where the pulse on a wire is (0 to 1), or None if it has none: one
+        # pulse after the output node produced a value, and a steady flow
+        # while the node it feeds is running
+        if self.states.get(connection.end_node) == "running" and self.states.get(connection.start_node) == "done":
+            return now % FLOW_SECONDS / FLOW_SECONDS
+        fired = self.fired.get(connection.start_node)
+        if fired is None or now - fired >= FLOW_SECONDS:
+            return None
+        return (now - fired) / FLOW_SECONDS
@@ -0,0 +1,286 @@
+# Trazas de ejecucion (.buetrace) y su reproduccion.
+#
+# With executor.tracer set to a TraceWriter, every node evaluation is appended
+# to a binary file: node, start and end times, a hash of its inputs and one of
+# its outputs, and now and then (sample_every) a short repr of the values. A
+# trace is written next to the .buepyt it ran and can be replayed against it:
+# nodes are named by their path in the project ("3", or "3/1" for the second
+# node inside the macro at index 3), the same order the .buepyt lists them.
+#
+# Layout (little endian):
+#   header   MAGIC, u16 version, f64 unix time of the start
+#   "N"      u32 node id, u16 + utf-8 path, u16 + utf-8 name (first use of a node)
+#   "E"      u32 node id, i64 start ns, i64 end ns, u64 input hash,
+#            u64 output hash, u8 status (0 ok, 1 error)
+#   "S"      u32 node id, u32 + utf-8 inputs repr, u32 + utf-8 outputs repr
+#            (sample of the "E" record just before; errors always get one,
+#            with the message as outputs)
+# Times count from the start of the trace. Records are fixed-size structs
+# written through a buffered file, so tracing costs a few microseconds per
+# node; a trace cut short by a crash is read up to its last whole record.
+#
+# Hashes are bounded in cost: big strings, bytes and arrays are hashed from
+# their size plus their first and last SAMPLE_BYTES, and containers from their
+# length plus their first SAMPLE_ITEMS items. Two equal values always get the
+# same hash, across runs and processes.
+import bisect
+import hashlib
+import reprlib
+import struct
+import time
+from shared_values import SharedValue, numpy_if_loaded
+
+MAGIC = b"BUETRACE"
+VERSION = 1
+SAMPLE_BYTES = 4096
+SAMPLE_ITEMS = 16
+MAX_DEPTH = 3
+
+_HEADER = struct.Struct("<8sHd")
+_NODE = struct.Struct("<IH")
+_EVALUATION = struct.Struct("<IqqQQB")
+_LENGTH16 = struct.Struct("<H")
+_LENGTH32 = struct.Struct("<I")
+_SAMPLE = struct.Struct("<I")
+
+_SCALARS = {type(None), bool, int, float, complex}
+
+_repr = reprlib.Repr()
+_repr.maxstring = 80
+_repr.maxother = 80
+
+
+class TraceError(Exception):
+    pass
+
+
+def node_paths(project, prefix=""):
+    # {node: path} for every node of the project and of its macros
+    paths = {}
+    for index, node in enumerate(project.nodes):
+        path = f"{prefix}{index}"
+        paths[node] = path
+        inner = getattr(node, "inner", None)
+        if inner is not None:
+            paths.update(node_paths(inner, path + "/"))
+    return paths
+
+
+def resolve_path(project, path):
+    # The node at a path, or None if the project has no such node
+    node = None
+    for part in path.split("/"):
+        if project is None or not part.isdigit() or int(part) >= len(project.nodes):
+            return None
+        node = project.nodes[int(part)]
+        project = getattr(node, "inner", None)
+    return node
+
+
+def _edges(data):
+    if len(data) <= 2 * SAMPLE_BYTES:
+        return bytes(data)
+    return bytes(data[:SAMPLE_BYTES]) + bytes(data[-SAMPLE_BYTES:])
+
+
+def _is_ndarray(value):
+    numpy = numpy_if_loaded()
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _fingerprint(value, parts, view, depth):
+    if type(value) in _SCALARS:
+        # The repr tells the types apart (1, 1.0, True)
+        parts.append(repr(value).encode())
+        return
+    parts.append(type(value).__name__.encode())
+    if isinstance(value, (bool, int, float, complex)):
+        parts.append(repr(value).encode())
+    elif isinstance(value, str):
+        if len(value) > 2 * SAMPLE_BYTES:
+            value = value[:SAMPLE_BYTES] + value[-SAMPLE_BYTES:] + str(len(value))
+        parts.append(value.encode("utf-8", "surrogatepass"))
+    elif isinstance(value, (bytes, bytearray)):
+        parts.append(str(len(value)).encode() + _edges(value))
+    elif isinstance(value, SharedValue):
+        if view is not None:
+            parts.pop()
+            _fingerprint(view(value), parts, view, depth)
+        else:
+            parts.append(f"{value.kind}{value.size}{value.layout}".encode())
+    elif _is_ndarray(value):
+        parts.append(f"{value.shape}{value.dtype.str}".encode())
+        # The bytes of an object array are pointers: it goes by shape and dtype only
+        if not value.dtype.hasobject and value.flags.c_contiguous:
+            parts.append(_edges(value.reshape(-1).view("u1")))
+        elif not value.dtype.hasobject:
+            count = max(1, SAMPLE_BYTES // value.itemsize)
+            parts.append(value.flat[:count].tobytes() + value.flat[-count:].tobytes())
+    elif depth < MAX_DEPTH and isinstance(value, (tuple, list)):
+        parts.append(str(len(value)).encode())
+        for item in value[:SAMPLE_ITEMS]:
+            _fingerprint(item, parts, view, depth + 1)
+    elif depth < MAX_DEPTH and isinstance(value, dict):
+        parts.append(str(len(value)).encode())
+        for count, (key, item) in enumerate(value.items()):
+            if count == SAMPLE_ITEMS:
+                break
+            _fingerprint(key, parts, view, depth + 1)
+            _fingerprint(item, parts, view, depth + 1)
+    elif hasattr(value, "__len__"):
+        parts.append(str(len(value)).encode())
+
+
+def value_hash(value, view=None):
+    # view(shared value) gives the value behind a SharedValue (executor.shared.view)
+    parts = []
+    _fingerprint(value, parts, view, 0)
+    return int.from_bytes(hashlib.blake2b(b"\0".join(parts), digest_size=8).digest(), "little")
+
+
+class TraceWriter:
+    def __init__(self, path, project, sample_every=0):
+        # sample_every: keep the values of one evaluation in that many (0: never)
+        self.paths = node_paths(project)
+        self.sample_every = sample_every
+        self.count = 0
+        self._ids = {}
+        self._start = time.perf_counter_ns()
+        self._file = open(path, "wb", buffering=1 << 16)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time()))
+
+    def _node_id(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = len(self._ids)
+            self._ids[node] = node_id
+            path = self.paths.get(node, "?").encode()
+            name = str(node.name).encode()[:1000]
+            self._file.write(b"N" + _NODE.pack(node_id, len(path)) + path + _LENGTH16.pack(len(name)) + name)
+        return node_id
+
+    def record(self, node, start, end, args, outputs=None, error=None, view=None):
+        # start, end: time.perf_counter_ns(); error: message if the node failed
+        node_id = self._node_id(node)
+        self._file.write(b"E" + _EVALUATION.pack(node_id, start - self._start, end - self._start, value_hash(args, view),
+                                                 value_hash(outputs, view), 0 if error is None else 1))
+        self.count += 1
+        if error is not None or (self.sample_every and self.count % self.sample_every == 0):
+            if view is not None:
+                args = [view(arg) if isinstance(arg, SharedValue) else arg for arg in args]
+                if outputs is not None:
+                    outputs = [view(value) if isinstance(value, SharedValue) else value for value in outputs]
+            inputs_text = _repr.repr(args).encode()
+            outputs_text = (error if error is not None else _repr.repr(outputs)).encode()
+            self._file.write(b"S" + _SAMPLE.pack(node_id) + _LENGTH32.pack(len(inputs_text)) + inputs_text
+                             + _LENGTH32.pack(len(outputs_text)) + outputs_text)
+
+    def close(self):
+        self._file.close()
+
+
+class Evaluation:
+    __slots__ = ("node", "start", "end", "input_hash", "output_hash", "error", "sample")
+
+    def __init__(self, node, start, end, input_hash, output_hash, error):
+        self.node = node  # Node id in the trace
+        self.start = start  # Seconds from the start of the trace
+        self.end = end
+        self.input_hash = input_hash
+        self.output_hash = output_hash
+        self.error = error
+        self.sample = None  # (inputs repr, outputs repr or error message)
+
+
+class Trace:
+    def __init__(self, created):
+        self.created = created  # Unix time of the start
+        self.nodes = {}  # {node id: (path, name)}
+        self.evaluations = []  # In the order they ended
+        self.duration = 0.0  # Seconds until the last end (read every frame of a replay)
+
+    def add(self, evaluation):
+        self.evaluations.append(evaluation)
+        self.duration = max(self.duration, evaluation.end)
+
+
+def read_trace(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < _HEADER.size:
+        raise TraceError(f"{path}: not a trace file")
+    magic, version, created = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise TraceError(f"{path}: not a trace file")
+    if version != VERSION:
+        raise TraceError(f"{path}: trace version {version} is not supported")
+    trace = Trace(created)
+    offset = _HEADER.size
+    try:
+        while offset < len(data):
+            kind = data[offset:offset + 1]
+            offset += 1
+            if kind == b"E":
+                node, start, end, input_hash, output_hash, status = _EVALUATION.unpack_from(data, offset)
+                offset += _EVALUATION.size
+                trace.add(Evaluation(node, start / 1e9, end / 1e9, input_hash, output_hash, status == 1))
+            elif kind == b"N":
+                node, length = _NODE.unpack_from(data, offset)
+                offset += _NODE.size
+                node_path = data[offset:offset + length].decode()
+                offset += length
+                (length,) = _LENGTH16.unpack_from(data, offset)
+                offset += _LENGTH16.size
+                name = data[offset:offset + length].decode(errors="replace")
+                offset += length
+                trace.nodes[node] = (node_path, name)
+            elif kind == b"S":
+                offset += _SAMPLE.size
+                texts = []
+                for _ in range(2):
+                    (length,) = _LENGTH32.unpack_from(data, offset)
+                    offset += _LENGTH32.size
+                    if offset + length > len(data):
+                        raise struct.error("cut short")
+                    texts.append(data[offset:offset + length].decode(errors="replace"))
+                    offset += length
+                if trace.evaluations:
+                    trace.evaluations[-1].sample = tuple(texts)
+            else:
+                raise TraceError(f"{path}: bad record at byte {offset - 1}")
+    except (struct.error, UnicodeDecodeError):
+        pass  # The writer stopped in the middle of a record
+    return trace
+
+
+class Replay:
+    # State of every node of a trace at any time, for scrubbing through it
+    def __init__(self, trace):
+        self.trace = trace
+        self._starts = {}  # {node id: [start of each evaluation]}
+        self._evaluations = {}  # {node id: [evaluation]}, by start
+        for evaluation in sorted(trace.evaluations, key=lambda evaluation: evaluation.start):
+            self._starts.setdefault(evaluation.node, []).append(evaluation.start)
+            self._evaluations.setdefault(evaluation.node, []).append(evaluation)
+
+    def at(self, t):
+        # {node id: (state, evaluation)} at time t: the last evaluation that
+        # started by then, "running" if it hadn't ended yet
+        states = {}
+        for node, starts in self._starts.items():
+            index = bisect.bisect_right(starts, t) - 1
+            if index < 0:
+                continue
+            evaluation = self._evaluations[node][index]
+            if evaluation.end > t:
+                states[node] = ("running", evaluation)
+            else:
+                states[node] = ("error" if evaluation.error else "done", evaluation)
+        return states
+
+    def last_sample(self, node, t):
+        # The newest sampled values of a node up to time t
+        for evaluation in reversed(self._evaluations.get(node, [])[:bisect.bisect_right(self._starts.get(node, []), t)]):
+            if evaluation.sample is not None and evaluation.end <= t:
+                return evaluation.sample
+        return None
@@ -0,0 +1,216 @@
+# Ejecucion del codigo de los nodos en procesos aparte.
+#
+# A SandboxPool keeps a few worker processes running. A task is the source of a
+# node function (see executor.node_source) plus its arguments; every worker
+# compiles a function the first time it gets it and keeps it, so later calls
+# only send the arguments. Per task:
+#   - timeout      wall-clock seconds; the worker is killed and replaced
+#   - cpu_seconds  CPU time (RLIMIT_CPU, set before every call)
+#   - memory_mb    address space of the worker (RLIMIT_AS, set once)
+# The limits from the resource module only exist on Unix; on Windows only the
+# timeout applies. A worker that dies is replaced right away and its task is
+# tried once more on the new worker; a second crash is reported as an error.
+#
+# Large arguments and results travel as shared memory blocks (shared_values.py):
+# a worker maps the blocks of its arguments and writes big results into new
+# blocks, which the IDE process maps as soon as it gets the reply. Those blocks
+# are named after the task: when a worker is killed or lost with a task, or
+# its reply is an error, the pool unlinks the blocks of that task (nobody
+# adopted them, so nothing else would).
+import multiprocessing
+import secrets
+import signal
+import time
+from multiprocessing.connection import wait
+from shared_values import attach, share_outputs, unlink_task_blocks, unpack
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TIMEOUT = 10.0
+CPU_SECONDS = 5
+MEMORY_MB = 2048
+SIGXCPU = getattr(signal, "SIGXCPU", None)  # Sent when RLIMIT_CPU runs out
+
+
+def _limit_cpu(seconds):
+    if resource is None:
+        return
+    if seconds is None:
+        limit = resource.RLIM_INFINITY
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY and (limit == resource.RLIM_INFINITY or limit > hard):
+        limit = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+
+def _worker(connection, memory_mb):
+    if resource is not None and memory_mb:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        limit = memory_mb * 1024 * 1024
+        if hard == resource.RLIM_INFINITY or limit < hard:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    functions = {}
+    attached = {}  # Shared blocks of the arguments, {name: block}
+    created = []  # Blocks written for the last result
+
+    def get_block(name):
+        if name not in attached:
+            attached[name] = attach(name)
+        return attached[name]
+
+    while True:
+        try:
+            key, source, name, args, cpu_seconds, prefix = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        # The IDE mapped the blocks of the previous result when it got it
+        for block in created:
+            block.close()
+        created = []
+        try:
+            function = functions.get(key)
+            if function is None:
+                scope = {}
+                exec(compile(source, f"<{name}>", "exec"), scope)
+                function = scope["__node"]
+                functions[key] = function
+            args = [unpack(arg, get_block) for arg in args]
+            _limit_cpu(cpu_seconds)
+            try:
+                value = function(*args)
+            finally:
+                _limit_cpu(None)
+            reply = (True, share_outputs(value, created, prefix))
+        except BaseException as error:  # SystemExit too: node code can't stop the worker
+            reply = (False, f"{type(error).__name__}: {error}")
+        try:
+            connection.send(reply)
+        except Exception as error:
+            connection.send((False, f"result can't be sent back: {error}"))
+        # Unmap the argument blocks nothing points to any more
+        args = value = reply = None
+        for block_name, block in list(attached.items()):
+            try:
+                block.close()
+            except BufferError:
+                continue
+            del attached[block_name]
+
+
+class _Worker:
+    def __init__(self, memory_mb):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker, args=(child, memory_mb), daemon=True)
+        self.process.start()
+        child.close()
+        self.known = set()  # Function keys already compiled in this worker
+        self.task = None  # (task id, message, deadline, attempt, block prefix)
+
+    def send(self, task_id, key, source, name, args, cpu_seconds, timeout, prefix, attempt=1):
+        message = (key, None if key in self.known else source, name, args, cpu_seconds, prefix)
+        self.known.add(key)
+        self.task = (task_id, (key, source, name, args, cpu_seconds), time.monotonic() + timeout, attempt, prefix)
+        self.connection.send(message)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        if self.task is not None:
+            # The result of the task was never adopted (or never finished)
+            unlink_task_blocks(self.task[4])
+
+
+class SandboxPool:
+    def __init__(self, workers=None, timeout=TIMEOUT, cpu_seconds=CPU_SECONDS, memory_mb=MEMORY_MB):
+        self.size = workers or min(4, multiprocessing.cpu_count())
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.workers = []
+        self.restarts = 0
+        self._prefix = "bue" + secrets.token_hex(4)  # Of the shared blocks of the results
+        self._sent = 0
+
+    def start(self):
+        # Pre-forks the workers (done on the first task otherwise)
+        while len(self.workers) < self.size:
+            self.workers.append(_Worker(self.memory_mb))
+
+    def idle(self):
+        self.start()
+        return [worker for worker in self.workers if worker.task is None]
+
+    def submit(self, task_id, key, source, name, args):
+        # Returns False if every worker is busy
+        idle = self.idle()
+        if not idle:
+            return False
+        self._send(idle[0], task_id, key, source, name, args, self.cpu_seconds)
+        return True
+
+    def _send(self, worker, task_id, key, source, name, args, cpu_seconds, attempt=1):
+        self._sent += 1
+        worker.send(task_id, key, source, name, args, cpu_seconds, self.timeout, f"{self._prefix}_{self._sent}", attempt)
+
+    def _restart(self, worker):
+        index = self.workers.index(worker)
+        worker.kill()
+        self.workers[index] = _Worker(self.memory_mb)
+        self.restarts += 1
+        return self.workers[index]
+
+    def wait(self, timeout=None):
+        # Finished tasks as [(task id, ok, value or error message)]
+        busy = [worker for worker in self.workers if worker.task is not None]
+        if not busy:
+            return []
+        now = time.monotonic()
+        first_deadline = min(worker.task[2] for worker in busy)
+        limit = max(0.0, first_deadline - now)
+        ready = wait([worker.connection for worker in busy], limit if timeout is None else min(timeout, limit))
+        done = []
+        for worker in busy:
+            task_id, message, deadline, attempt, prefix = worker.task
+            if worker.connection in ready:
+                try:
+                    ok, value = worker.connection.recv()
+                except (EOFError, OSError):
+                    # The worker died: CPU limit, or a crash (tried once more)
+                    worker.process.join()
+                    exitcode = worker.process.exitcode
+                    new = self._restart(worker)
+                    if SIGXCPU is not None and exitcode == -SIGXCPU:
+                        done.append((task_id, False, f"CPU limit exceeded ({self.cpu_seconds} s)"))
+                    elif attempt == 1:
+                        key, source, name, args, cpu_seconds = message
+                        self._send(new, task_id, key, source, name, args, cpu_seconds, attempt=2)
+                    else:
+                        done.append((task_id, False, f"worker process crashed (exit code {exitcode})"))
+                    continue
+                worker.task = None
+                if not ok:
+                    # The result may have been shared before it failed to be sent
+                    unlink_task_blocks(prefix)
+                done.append((task_id, ok, value))
+            elif time.monotonic() >= deadline:
+                self._restart(worker)
+                done.append((task_id, False, f"timed out after {self.timeout} s"))
+        return done
+
+    def abort(self):
+        # Kills the tasks still running (their workers are replaced)
+        for worker in list(self.workers):
+            if worker.task is not None:
+                self._restart(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
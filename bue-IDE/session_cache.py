@@ -0,0 +1,91 @@
+# Cache de la sesion: lo que hace falta para volver a abrir el IDE al instante.
+#
+# When the IDE closes it writes SESSION_FILE next to the project with:
+#   - camera: position and zoom level of the canvas
+#   - project: the last project opened or saved, already built (the node
+#     records plus the spatial cells, evaluation order and type errors the
+#     Project otherwise works out node by node, see Project.to_snapshot)
+#   - library: the palette of the node library with its search index built
+# Every part but the camera is stored with the hashes of the files it was made
+# from (the .buepyt, the library indexes) and is only used while they still
+# match; otherwise the IDE loads those files as usual. The whole cache is
+# dropped if the code that builds those structures changed (code_key).
+#
+# The file is marshal data (plain values only, nothing in it can run code) and
+# is written to a temporary file and renamed, so a crash while writing leaves
+# the previous cache or none.
+import hashlib
+import marshal
+import os
+import sys
+
+SESSION_FILE = "bue-session.cache"
+VERSION = 1
+
+
+def file_hash(path):
+    # blake2b of the contents, or None if the file can't be read
+    try:
+        with open(path, "rb") as file:
+            return hashlib.blake2b(file.read(), digest_size=16).digest()
+    except OSError:
+        return None
+
+
+def file_hashes(paths):
+    return {path: file_hash(path) for path in paths}
+
+
+def unchanged(hashes):
+    # True if every file still has the hash it had
+    return all(file_hash(path) == digest for path, digest in hashes.items())
+
+
+def code_key(paths):
+    # Identifies the code that wrote a cache: the hashes of its sources (or
+    # the executable of a frozen build, which has no sources)
+    if getattr(sys, "frozen", False):
+        stat = os.stat(sys.executable)
+        return (sys.version, sys.executable, stat.st_size, stat.st_mtime_ns)
+    return (sys.version,) + tuple(file_hash(path) for path in paths)
+
+
+def project_entry(filename, snapshot):
+    # A project snapshot taken right after it was read from or written to
+    # filename (packed now, so later edits to the project don't change it)
+    return {"file": filename, "hash": file_hash(filename), "snapshot": marshal.dumps(snapshot)}
+
+
+def project_snapshot(entry):
+    # The snapshot of a project entry, or None if its file changed since
+    if file_hash(entry["file"]) != entry["hash"]:
+        return None
+    return marshal.loads(entry["snapshot"])
+
+
+def load_session(path, key):
+    # The saved session, or None if there is none or other code wrote it
+    try:
+        with open(path, "rb") as file:
+            session = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(session, dict) or session.get("version") != VERSION or session.get("key") != key:
+        return None
+    return session
+
+
+def save_session(path, key, session):
+    session = dict(session, version=VERSION, key=key)
+    temporary = path + ".tmp"
+    try:
+        with open(temporary, "wb") as file:
+            marshal.dump(session, file)
+        os.replace(temporary, path)
+    except (OSError, ValueError) as error:
+        # ValueError: something in the session is not plain data
+        print(f"{path}: session not saved: {error}")
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
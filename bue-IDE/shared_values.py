@@ -0,0 +1,215 @@
+# Valores grandes entre procesos por memoria compartida.
+#
+# When node code runs in the sandbox workers, a large output is written once
+# into a multiprocessing.shared_memory block and only a small SharedValue
+# (block name and layout) travels through the pipes. Every node that reads it
+# maps the same block:
+#   - NumPy arrays and tables (dicts of 1-D arrays of the same length) arrive
+#     as read-only arrays on the shared memory, without a copy
+#   - bytes and bytearrays arrive as bytes (one copy out of the block, no
+#     pickling)
+# Values under SHARE_MIN_BYTES, and anything else, are pickled as usual.
+#
+# The IDE process owns the blocks (SharedStore): a block has one reference for
+# the results of the run plus one per task using it, and is unlinked when the
+# count drops to zero. The workers never unlink anything. Until the IDE adopts
+# a result nobody tracks its blocks, so they are named after their task
+# ("<task prefix>_0", "_1"... in order): when a worker is killed or dies with a
+# task, the pool unlinks that task's blocks by name (unlink_task_blocks).
+# Adopted blocks are known to the IDE's resource tracker, which removes them
+# if the IDE dies.
+#
+# NumPy is never imported here just to look at a value: until something
+# imported it there can't be any array (see numpy_if_loaded).
+import sys
+from multiprocessing import shared_memory
+
+try:
+    from multiprocessing import resource_tracker
+except ImportError:
+    resource_tracker = None
+
+SHARE_MIN_BYTES = 64 * 1024
+ALIGN = 64
+
+
+class SharedValue:
+    def __init__(self, name, kind, size, layout):
+        self.name = name
+        self.kind = kind  # "bytes", "array" or "table"
+        self.size = size
+        self.layout = layout
+
+    def __repr__(self):
+        return f"<shared {self.kind}, {self.size} bytes>"
+
+
+def _untrack(block):
+    # The resource tracker of a process unlinks the blocks it saw when the
+    # process ends; only the IDE decides when a block goes away
+    if resource_tracker is not None:
+        try:
+            resource_tracker.unregister(block._name, "shared_memory")
+        except Exception:
+            pass
+
+
+def _create(size, blocks, prefix):
+    # The next block of a task (appended to blocks)
+    block = shared_memory.SharedMemory(f"{prefix}_{len(blocks)}", create=True, size=max(size, 1))
+    _untrack(block)
+    blocks.append(block)
+    return block
+
+
+def attach(name):
+    block = shared_memory.SharedMemory(name=name)
+    _untrack(block)
+    return block
+
+
+def unlink_task_blocks(prefix):
+    # Removes the blocks a task created, if it got to create any
+    index = 0
+    while True:
+        try:
+            # Tracked while it exists here, unlink() untracks it
+            block = shared_memory.SharedMemory(name=f"{prefix}_{index}")
+        except FileNotFoundError:
+            return
+        block.close()
+        block.unlink()
+        index += 1
+
+
+def numpy_if_loaded():
+    return sys.modules.get("numpy")
+
+
+def _is_array(value):
+    numpy = numpy_if_loaded()
+    return numpy is not None and isinstance(value, numpy.ndarray) and not value.dtype.hasobject
+
+
+def _is_table(value):
+    if not isinstance(value, dict) or not value:
+        return False
+    columns = list(value.values())
+    return all(_is_array(column) and column.ndim == 1 and len(column) == len(columns[0]) for column in columns)
+
+
+def _padded(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def share(value, blocks, prefix):
+    # A SharedValue for a large value (its new block is added to blocks), or
+    # the value itself
+    if isinstance(value, (bytes, bytearray)):
+        if len(value) < SHARE_MIN_BYTES:
+            return value
+        block = _create(len(value), blocks, prefix)
+        block.buf[:len(value)] = value
+        return SharedValue(block.name, "bytes", len(value), None)
+    if _is_array(value):
+        if value.nbytes < SHARE_MIN_BYTES:
+            return value
+        numpy = numpy_if_loaded()
+        block = _create(value.nbytes, blocks, prefix)
+        numpy.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+        return SharedValue(block.name, "array", value.nbytes, (value.shape, value.dtype.str))
+    if _is_table(value):
+        size = sum(_padded(column.nbytes) for column in value.values())
+        if size < SHARE_MIN_BYTES:
+            return value
+        numpy = numpy_if_loaded()
+        block = _create(size, blocks, prefix)
+        layout = []
+        offset = 0
+        for name, column in value.items():
+            numpy.ndarray(column.shape, column.dtype, buffer=block.buf, offset=offset)[...] = column
+            layout.append((name, offset, column.shape, column.dtype.str))
+            offset += _padded(column.nbytes)
+        return SharedValue(block.name, "table", size, layout)
+    return value
+
+
+def share_outputs(value, blocks, prefix):
+    # A node with several outputs returns a tuple/list: its items are shared
+    if isinstance(value, (tuple, list)):
+        return type(value)(share(item, blocks, prefix) for item in value)
+    return share(value, blocks, prefix)
+
+
+def load(handle, block, copy=False):
+    if handle.kind == "bytes":
+        return bytes(block.buf[:handle.size])
+    import numpy  # The process that shared the array had it
+    if handle.kind == "array":
+        shape, dtype = handle.layout
+        array = numpy.ndarray(shape, numpy.dtype(dtype), buffer=block.buf)
+        if copy:
+            return array.copy()
+        array.flags.writeable = False
+        return array
+    table = {}
+    for name, offset, shape, dtype in handle.layout:
+        column = numpy.ndarray(shape, numpy.dtype(dtype), buffer=block.buf, offset=offset)
+        if copy:
+            column = column.copy()
+        else:
+            column.flags.writeable = False
+        table[name] = column
+    return table
+
+
+def handles(value):
+    # The SharedValues in a value (itself, or the items of a tuple/list)
+    if isinstance(value, SharedValue):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [item for item in value if isinstance(item, SharedValue)]
+    return []
+
+
+def unpack(value, get_block, copy=False):
+    if isinstance(value, SharedValue):
+        return load(value, get_block(value.name), copy)
+    if isinstance(value, (tuple, list)) and handles(value):
+        return type(value)(unpack(item, get_block, copy) for item in value)
+    return value
+
+
+class SharedStore:
+    def __init__(self):
+        self._blocks = {}  # {name: [block, references]}
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def adopt(self, value):
+        # A task returned value: its blocks start with the run's reference.
+        # Mapped tracked here (unlink() in release() untracks them again).
+        for handle in handles(value):
+            self._blocks[handle.name] = [shared_memory.SharedMemory(name=handle.name), 1]
+
+    def acquire(self, value):
+        for handle in handles(value):
+            self._blocks[handle.name][1] += 1
+
+    def release(self, value):
+        for handle in handles(value):
+            entry = self._blocks[handle.name]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._blocks[handle.name]
+                entry[0].close()
+                entry[0].unlink()
+
+    def view(self, value):
+        # The value of a SharedValue, read in place (drop it before release())
+        return load(value, self._blocks[value.name][0])
+
+    def materialize(self, value):
+        # Copy of the value in this process (the blocks are not released)
+        return unpack(value, lambda name: self._blocks[name][0], copy=True)
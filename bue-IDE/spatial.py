@@ -0,0 +1,72 @@
+# Indice espacial de los nodos (grid hash).
+# The canvas is split into square cells; every node is listed in the cells its
+# rect touches, so point and rect queries only look at nearby nodes.
+# A cell is one int (_key) and its nodes a list: most cells hold one or two
+# nodes, and with 100k nodes tuple keys and sets made most of the memory of a
+# project.
+
+CELL_SIZE = 256
+
+
+def _key(cx, cy):
+    # One int per cell (the canvas is far smaller than 2**31 cells)
+    return cx * 0x100000000 + cy
+
+
+def _cells(x, y, width, height):
+    x0 = int(x // CELL_SIZE)
+    y0 = int(y // CELL_SIZE)
+    x1 = int((x + max(width, 1) - 1) // CELL_SIZE)
+    y1 = int((y + max(height, 1) - 1) // CELL_SIZE)
+    return tuple(_key(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+
+
+class SpatialHash:
+    def __init__(self):
+        self._grid = {}
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def insert(self, node):
+        rect = node.rect
+        cells = _cells(rect.x, rect.y, rect.width, rect.height)
+        self._cells[node] = cells
+        for cell in cells:
+            self._grid.setdefault(cell, []).append(node)
+
+    def restore(self, node, cells):
+        # insert() with the cells it gave before (Project.from_snapshot)
+        self._cells[node] = cells
+        for cell in cells:
+            self._grid.setdefault(cell, []).append(node)
+
+    def remove(self, node):
+        for cell in self._cells.pop(node, ()):
+            bucket = self._grid[cell]
+            bucket.remove(node)
+            if not bucket:
+                del self._grid[cell]
+
+    def update(self, nodes):
+        # Call after moving or resizing nodes
+        for node in nodes:
+            self.remove(node)
+            self.insert(node)
+
+    def query_rect(self, x, y, width, height):
+        # Nodes whose rect intersects the given rect
+        found = set()
+        for cell in _cells(x, y, width, height):
+            bucket = self._grid.get(cell)
+            if bucket:
+                found.update(bucket)
+        right = x + width
+        bottom = y + height
+        return set(node for node in found
+                   if node.rect.x < right and node.rect.right > x and node.rect.y < bottom and node.rect.bottom > y)
+
+    def query_point(self, x, y):
+        bucket = self._grid.get(_key(int(x // CELL_SIZE), int(y // CELL_SIZE)), ())
+        return [node for node in bucket if node.rect.collidepoint(x, y)]
@@ -0,0 +1,71 @@
+# Runs of the executor with the sandbox pool.
+#   python -m pytest tests
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from executor import Executor
+from sandbox import SandboxPool
+
+
+class Project:
+    # The parts of the IDE project the executor reads (no wires here)
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.type_errors = set()
+
+    def evaluation_order(self):
+        return list(self.nodes)
+
+    def incoming(self, node, port=None):
+        return []
+
+    def outgoing(self, node, port=None):
+        return []
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Node:
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code
+        self.inputs = []
+        self.outputs = ["Result"]
+        self.input_types = []
+        self.output_types = ["Any"]
+
+
+def shared_blocks(pool):
+    return [name for name in os.listdir("/dev/shm") if name.startswith(pool._prefix)] if os.path.isdir("/dev/shm") else []
+
+
+def test_cancel_in_the_middle_of_a_batch():
+    nodes = [Node(f"Big {i}", "return bytes(1000000)") for i in range(3)]
+    pool = SandboxPool(workers=3)
+    executor = Executor(pool)
+    started = []
+
+    def listener(event, node, value):
+        if event == "start":
+            started.append(node)
+            if len(started) == len(nodes):
+                time.sleep(1.0)  # Every result is back before the pool is waited on
+        elif event == "done":
+            raise Cancelled()
+
+    executor.listener = listener
+    try:
+        try:
+            executor.run(Project(nodes))
+        except Cancelled:
+            pass
+        else:
+            raise AssertionError("the run was not cancelled")
+        assert len(executor.shared) == 0
+        assert shared_blocks(pool) == []
+    finally:
+        pool.close()
@@ -0,0 +1,102 @@
+# Orden topologico incremental (algoritmo de Pearce y Kelly).
+#
+# Every node has a position; for every edge x -> y, position(x) < position(y).
+# Adding an edge that already goes forward costs nothing. An edge that goes
+# backward only reorders the nodes between the two positions that are
+# reachable from its ends, and a path back to the start means a cycle, which is
+# rejected before anything changes. Removing edges or nodes never breaks the
+# order, so the list returned by order() stays valid until it changes.
+
+
+class CycleError(ValueError):
+    pass
+
+
+class TopologicalOrder:
+    def __init__(self):
+        self._slots = []  # node at each position, None for removed nodes
+        self._position = {}
+        self._order = None
+
+    def __len__(self):
+        return len(self._position)
+
+    def position(self, node):
+        return self._position[node]
+
+    def add(self, node):
+        self._position[node] = len(self._slots)
+        self._slots.append(node)
+        self._order = None
+
+    def restore(self, nodes):
+        # Nodes already in a valid order (an order() saved before)
+        self._slots = list(nodes)
+        self._position = {node: i for i, node in enumerate(self._slots)}
+        self._order = None
+
+    def remove(self, node):
+        self._slots[self._position.pop(node)] = None
+        self._order = None
+        if len(self._slots) > 2 * len(self._position) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._slots = [node for node in self._slots if node is not None]
+        for i, node in enumerate(self._slots):
+            self._position[node] = i
+
+    def order(self):
+        # Nodes in evaluation order (cached until the order changes)
+        if self._order is None:
+            self._order = [node for node in self._slots if node is not None]
+        return self._order
+
+    def add_edge(self, start, end, successors, predecessors):
+        # successors(node)/predecessors(node) give the nodes connected after /
+        # before it, without the new edge. Raises CycleError if start is
+        # reachable from end.
+        lower = self._position[end]
+        upper = self._position[start]
+        if start is end:
+            raise CycleError("a node can't be connected to itself")
+        if upper < lower:
+            return
+
+        forward = self._search(end, successors, lambda p: p <= upper, start)
+        backward = self._search(start, predecessors, lambda p: p >= lower, None)
+
+        # The nodes that must come before end keep their relative order, then
+        # the ones reachable from end; they reuse the same set of positions.
+        backward.sort(key=self._position.get)
+        forward.sort(key=self._position.get)
+        nodes = backward + forward
+        positions = sorted(self._position[node] for node in nodes)
+        for node, position in zip(nodes, positions):
+            self._position[node] = position
+            self._slots[position] = node
+        self._order = None
+
+    def _search(self, first, neighbours, in_range, target):
+        seen = {first}
+        stack = [first]
+        while stack:
+            node = stack.pop()
+            for neighbour in neighbours(node):
+                if neighbour is target:
+                    raise CycleError("connection would create a cycle")
+                if neighbour not in seen and in_range(self._position[neighbour]):
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        return list(seen)
+
+    def reachable(self, firsts, neighbours):
+        # Every node reachable from the given nodes (included)
+        seen = set(firsts)
+        stack = list(seen)
+        while stack:
+            for neighbour in neighbours(stack.pop()):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        return seen